@@ -1,15 +1,22 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from cache import TTLCache
 from config import settings
 from db import db
 from models import TokenData, UserInDB
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login", auto_error=False)
+
+# Token subject (phone) -> user document. Invalidate on any change to the user.
+user_cache = TTLCache(settings.USER_CACHE_MAX_SIZE, settings.USER_CACHE_TTL_SECONDS)
 
 def verify_password(plain_password, hashed_password):
     # Bcrypt has a 72-byte limit. Truncate to avoid errors for long passwords.
@@ -25,20 +32,38 @@ def verify_password(plain_password, hashed_password):
 
 def get_password_hash(password):
     # Bcrypt has a 72-byte limit. Truncate to avoid "password too long" errors.
-    print(f"DEBUG_HASH: Input Type: {type(password)}")
     if isinstance(password, str):
         # Check byte length
         encoded = password.encode('utf-8')
-        print(f"DEBUG_HASH: Encoded Length: {len(encoded)}")
         if len(encoded) > 71:
-            print("DEBUG_HASH: Truncating password...")
             # Truncate to 71 bytes to be safe and decode back to string
             # ignoring any partial multibyte characters at the end
             password = encoded[:71].decode('utf-8', errors='ignore')
-            print(f"DEBUG_HASH: New Length: {len(password.encode('utf-8'))}")
             
     return pwd_context.hash(password)
 
+# bcrypt is deliberately slow (~250 ms); run it off the event loop so other requests
+# keep flowing. The semaphore caps how many hashes are queued or running at once.
+_password_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="password-hash"
+)
+_password_slots = asyncio.Semaphore(settings.PASSWORD_HASH_MAX_CONCURRENCY)
+
+async def _run_password_task(func, *args):
+    async with _password_slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_password_executor, func, *args)
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    return await _run_password_task(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password) -> str:
+    return await _run_password_task(get_password_hash, password)
+
+def shutdown_password_executor():
+    _password_executor.shutdown(wait=False, cancel_futures=True)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -50,11 +75,26 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
+    return await _resolve_user(token)
+
+async def get_current_user_for_stream(
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    access_token: Optional[str] = None
+):
+    """
+    Like get_current_user, but also accepts the token as an `access_token` query
+    parameter since browser EventSource connections cannot send headers.
+    """
+    return await _resolve_user(token or access_token)
+
+async def _resolve_user(token: Optional[str]):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    if not token:
+        raise credentials_exception
     try:
         payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
         phone: str = payload.get("sub")
@@ -64,8 +104,11 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
     
-    user = await db.users.find_one({"phone": token_data.phone})
+    user = user_cache.get(token_data.phone)
     if user is None:
-        raise credentials_exception
+        user = await db.users.find_one({"phone": token_data.phone})
+        if user is None:
+            raise credentials_exception
+        user_cache.set(token_data.phone, user)
         
     return UserInDB(**user)
\ No newline at end of file
@@ -0,0 +1,93 @@
+import asyncio
+import os
+import sys
+
+# Add the current directory to sys.path so we can import from db and config
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pymongo import DESCENDING, UpdateMany, UpdateOne
+from db import db
+from geo import geo_point
+from places import resolve_place_keys
+from utils import to_object_ids
+
+BATCH_SIZE = 500
+
+async def backfill_locations():
+    """Set the GeoJSON `location` on destinations that have geo coordinates but no location."""
+    cursor = db.destinations.find(
+        {"geo.lat": {"$ne": None}, "location": None},
+        {"_id": 1, "geo": 1}
+    )
+    updated = 0
+    batch = []
+    async for destination in cursor:
+        point = geo_point(destination.get("geo"))
+        if point is None:
+            continue
+        batch.append(UpdateOne({"_id": destination["_id"]}, {"$set": {"location": point}}))
+        if len(batch) >= BATCH_SIZE:
+            updated += (await db.destinations.bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        updated += (await db.destinations.bulk_write(batch, ordered=False)).modified_count
+    print(f"Set location on {updated} destinations.")
+
+async def _link_places(destinations):
+    """Resolve a batch of destinations' places in one lookup and write their keys in one bulk write."""
+    keys = await resolve_place_keys(destinations)
+    result = await db.destinations.bulk_write([
+        UpdateOne({"_id": d["_id"]}, {"$set": {"place_key": key}})
+        for d, key in zip(destinations, keys)
+    ], ordered=False)
+    return result.modified_count
+
+async def backfill_place_keys():
+    """
+    Link destinations without a `place_key` to their canonical place, then copy the
+    key onto their schedules. Verified destinations go first so that unverified ones
+    with the same name are linked to the verified place.
+    """
+    cursor = db.destinations.find({"place_key": None}).sort("google_place_id", DESCENDING)
+    linked = 0
+    batch = []
+    async for destination in cursor:
+        batch.append(destination)
+        if len(batch) >= BATCH_SIZE:
+            linked += await _link_places(batch)
+            batch = []
+    if batch:
+        linked += await _link_places(batch)
+    print(f"Linked {linked} destinations to places.")
+
+    dest_ids = await db.schedules.distinct("destination_id", {"place_key": None})
+    updated = 0
+    for start in range(0, len(dest_ids), BATCH_SIZE):
+        chunk = dest_ids[start:start + BATCH_SIZE]
+        destinations = await db.destinations.find(
+            {"_id": {"$in": to_object_ids(chunk)}},
+            {"_id": 1, "place_key": 1}
+        ).to_list(None)
+        batch = [
+            UpdateMany(
+                {"destination_id": str(d["_id"]), "place_key": None},
+                {"$set": {"place_key": d["place_key"]}}
+            )
+            for d in destinations if d.get("place_key")
+        ]
+        if batch:
+            updated += (await db.schedules.bulk_write(batch, ordered=False)).modified_count
+    print(f"Set place_key on {updated} schedules.")
+
+async def main():
+    print("Starting destination backfill...")
+    await backfill_locations()
+    await backfill_place_keys()
+    print("Destination backfill complete.")
+
+if __name__ == "__main__":
+    # Fix for Windows asyncio loop policy
+    if os.name == 'nt':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    asyncio.run(main())
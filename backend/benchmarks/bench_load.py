@@ -0,0 +1,304 @@
+"""
+Load test with synthetic tribes: generate users, tribes, destinations and
+schedules at the requested scale, run matching over them, then drive the API
+with concurrent async clients and report throughput and p50/p95/p99 latency per
+endpoint, plus matching latency.
+
+Data goes into a scratch database on MONGODB_URI (--database, dropped before the
+run), or with --target memory into an in-process mongomock-motor stand-in
+(pip install mongomock-motor; no server needed, but its timings say little about
+a real Mongo). Requests go to the app in-process unless --base-url points at a
+running server, which must then use the same --database.
+
+Results are written as JSON (--output) so runs can be compared across commits.
+
+Usage (from backend/, with the usual .env):
+    python benchmarks/bench_load.py --users 50000 --requests 20000 --concurrency 64
+    python benchmarks/bench_load.py --target memory --users 500 --requests 1000
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import db as db_module
+from config import settings
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+def _patch_mongomock_bulk_sort():
+    """pymongo >= 4.11 passes `sort` to bulk update builders, which mongomock does not accept yet."""
+    import inspect
+    import mongomock.collection
+
+    builder = mongomock.collection.BulkOperationBuilder
+    if "sort" in inspect.signature(builder.add_update).parameters:
+        return
+    add_update = builder.add_update
+    builder.add_update = lambda self, *args, sort=None, **kwargs: add_update(self, *args, **kwargs)
+
+def use_database(target: str, name: str):
+    """Point the app at the benchmark database. Must run before the app modules are imported."""
+    if target == "memory":
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            sys.exit("--target memory needs mongomock-motor: pip install mongomock-motor")
+        _patch_mongomock_bulk_sort()
+        db_module.db = AsyncMongoMockClient()[name]
+    else:
+        db_module.db = db_module.client[name]
+    return db_module.db
+
+def percentile(sorted_values: list, q: float):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(q / 100 * len(sorted_values)) - 1)]
+
+def summarize(seconds: list) -> dict:
+    values = sorted(seconds)
+    ms = lambda v: round(v * 1000, 2) if v is not None else None
+    return {
+        "count": len(values),
+        "mean_ms": ms(sum(values) / len(values)) if values else None,
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "max_ms": ms(values[-1]) if values else None,
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class RequestMix:
+    """Weighted endpoint mix, shaped like the app's polling screens plus some writes."""
+
+    def __init__(self, data, rng: random.Random):
+        from synthetic import first_school_run
+        self.data = data
+        self.rng = rng
+        self.base = first_school_run(datetime.now(timezone.utc))
+        self.endpoints = [
+            # (label, weight, builder(user_id) -> (method, path, json body))
+            ("GET /api/v1/notifications/unread-count", 4, lambda uid: ("GET", "/api/v1/notifications/unread-count", None)),
+            ("GET /api/v1/matches/", 3, lambda uid: ("GET", "/api/v1/matches/?limit=50", None)),
+            ("GET /api/v1/schedules/", 3, lambda uid: ("GET", "/api/v1/schedules/", None)),
+            ("GET /api/v1/tribes/", 3, lambda uid: ("GET", "/api/v1/tribes/", None)),
+            ("GET /api/v1/notifications/", 2, lambda uid: ("GET", "/api/v1/notifications/", None)),
+            ("GET /api/v1/destinations/", 2, lambda uid: ("GET", "/api/v1/destinations/", None)),
+            ("GET /api/v1/tribes/{tribe_id}/members", 1, self._members),
+            ("POST /api/v1/schedules/", 1, self._create_schedule),
+        ]
+        self.weights = [weight for _, weight, _ in self.endpoints]
+
+    def _members(self, uid):
+        return "GET", f"/api/v1/tribes/{self.data.user_tribe[uid]}/members", None
+
+    def _create_schedule(self, uid):
+        from synthetic import pickup_time
+        destination_id = self.rng.choice(self.data.destinations_by_tribe[self.data.user_tribe[uid]])
+        body = {
+            "child_name": "Load Test",
+            "destination_id": destination_id,
+            "pickup_time": pickup_time(self.rng, self.base).isoformat(),
+            "recurrence": self.rng.choice(("weekly", "once")),
+        }
+        return "POST", "/api/v1/schedules/", body
+
+    def pick(self, uid):
+        label, _, build = self.rng.choices(self.endpoints, weights=self.weights)[0]
+        return (label, *build(uid))
+
+async def run_load(client: httpx.AsyncClient, data, args, tokens: dict) -> dict:
+    rng = random.Random(args.seed + 1)
+    mix = RequestMix(data, rng)
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    counter = itertools.count()
+    total = args.warmup + args.requests
+
+    async def worker():
+        while (n := next(counter)) < total:
+            uid = rng.choice(data.user_ids)
+            label, method, path, body = mix.pick(uid)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body, headers={"Authorization": f"Bearer {tokens[uid]}"})
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            elapsed = time.perf_counter() - started
+            if n < args.warmup:
+                continue
+            latencies[label].append(elapsed)
+            if failed:
+                errors[label] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    endpoints = {}
+    for label in sorted(latencies):
+        endpoints[label] = {
+            **summarize(latencies[label]),
+            "errors": errors[label],
+            "throughput_rps": round(len(latencies[label]) / elapsed, 2),
+        }
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(args.requests / elapsed, 2),
+        "errors": sum(errors.values()),
+        "endpoints": endpoints,
+    }
+
+async def run_matching(data, args) -> dict:
+    """Single-schedule latency on a sample, then one bulk pass over everything else."""
+    from matching import find_and_create_matches, find_and_create_matches_bulk
+
+    rng = random.Random(args.seed + 2)
+    sample = rng.sample(data.schedule_ids, min(args.match_sample, len(data.schedule_ids)))
+    single = []
+    for schedule_id in sample:
+        started = time.perf_counter()
+        await find_and_create_matches(schedule_id)
+        single.append(time.perf_counter() - started)
+
+    sampled = set(sample)
+    rest = [sid for sid in data.schedule_ids if sid not in sampled]
+    started = time.perf_counter()
+    await find_and_create_matches_bulk(rest)
+    bulk_seconds = time.perf_counter() - started
+
+    return {
+        "single_schedule": summarize(single),
+        "bulk": {
+            "schedules": len(rest),
+            "seconds": round(bulk_seconds, 3),
+            "schedules_per_second": round(len(rest) / bulk_seconds, 2) if bulk_seconds else None,
+        },
+    }
+
+async def main(args):
+    database = use_database(args.target, args.database)
+    # App modules bind `db` at import time, so they are imported after the switch
+    from auth import create_access_token
+    from indexes import ensure_indexes
+    from jobs import JobWorker
+    from peers import rebuild_peers
+    from synthetic import Scale, generate
+
+    if args.target == "mongo":
+        await db_module.client.drop_database(args.database)
+        await ensure_indexes()
+
+    scale = Scale(
+        users=args.users,
+        tribe_size=args.tribe_size,
+        places=args.places,
+        destinations_per_place=args.destinations_per_place,
+        places_per_tribe=args.places_per_tribe,
+        schedules_per_user=args.schedules_per_user,
+    )
+    print(f"Generating {scale} into {args.target}:{args.database}...")
+    started = time.perf_counter()
+    data = await generate(database, scale, seed=args.seed)
+    await rebuild_peers()
+    print(f"Generated in {time.perf_counter() - started:.1f}s")
+
+    print(f"Matching {len(data.schedule_ids)} schedules...")
+    matching = await run_matching(data, args)
+    print(json.dumps(matching, indent=2))
+
+    tokens = {uid: create_access_token(data={"sub": phone}) for uid, phone in data.phones.items()}
+    worker = None
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=30)
+    else:
+        import main as app_main
+        # ASGITransport skips startup events: run the job worker ourselves, as the inline worker would
+        logging.getLogger().setLevel(logging.WARNING)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app_main.app), base_url="http://bench", timeout=30)
+        worker = JobWorker()
+        worker.start()
+
+    print(f"Sending {args.requests} requests with concurrency {args.concurrency}...")
+    async with client:
+        load = await run_load(client, data, args, tokens)
+    if worker:
+        await worker.stop()
+        # Matching queued by the load that has not run yet, once its debounce delay is over
+        await asyncio.sleep(settings.MATCH_DEBOUNCE_SECONDS)
+        started = time.perf_counter()
+        await JobWorker().drain()
+        matching["queue_drain_seconds"] = round(time.perf_counter() - started, 3)
+
+    results = {
+        "benchmark": "load",
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "target": args.target,
+        "base_url": args.base_url,
+        "seed": args.seed,
+        "scale": scale._asdict(),
+        "schedules": len(data.schedule_ids),
+        "load": load,
+        "matching": matching,
+    }
+    for label, stats in load["endpoints"].items():
+        print(f"{label:45} {stats['count']:>6} req  {stats['throughput_rps']:>8} rps  "
+              f"p50 {stats['p50_ms']:>8} ms  p95 {stats['p95_ms']:>8} ms  p99 {stats['p99_ms']:>8} ms  errors {stats['errors']}")
+    print(f"Total: {load['throughput_rps']} rps, {load['errors']} errors")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"load-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=("mongo", "memory"), default="mongo")
+    parser.add_argument("--database", default="ridetribe_bench", help="Scratch database, dropped before the run")
+    parser.add_argument("--base-url", help="Drive a running server instead of the app in-process")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--tribe-size", type=int, default=20)
+    parser.add_argument("--places", type=int, default=0, help="0: one place per 10 users")
+    parser.add_argument("--destinations-per-place", type=int, default=2)
+    parser.add_argument("--places-per-tribe", type=int, default=3)
+    parser.add_argument("--schedules-per-user", type=int, default=2)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=100, help="Requests sent before measuring")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--match-sample", type=int, default=200, help="Schedules matched one at a time for latency")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="JSON results path (default benchmarks/results/load-<time>.json)")
+    args = parser.parse_args()
+    if args.base_url and args.target == "memory":
+        parser.error("--base-url needs --target mongo: an in-process stand-in is invisible to the server")
+
+    # Fix for Windows asyncio loop policy
+    if os.name == 'nt':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    asyncio.run(main(args))
@@ -0,0 +1,159 @@
+"""
+Micro-benchmarks for the matching hot path, on in-memory synthetic data.
+
+For each fixture size (tribe size x schedules per user x destinations per place)
+a fresh data set is generated into mongomock-motor and matching is run from
+scratch: once a schedule at a time on a sample (as a single edit does) and once
+as a bulk pass over every schedule (as a batch of queued jobs does). Reported per
+schedule: time, Mongo queries issued (counted with the query profiler) and
+matches created. Timings are the best of --repeat runs; mongomock is much slower
+than a real server, so compare runs with each other, not with production, and
+watch queries per schedule, which does not depend on the backend.
+
+calculate_trust_score is timed on its own as well.
+
+Usage (from backend/; needs pip install mongomock-motor):
+    python benchmarks/bench_matching.py
+    python benchmarks/bench_matching.py --tribe-sizes 10,50,200 --schedules-per-user 1,4 --output matching.json
+"""
+import argparse
+import asyncio
+import inspect
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+import timeit
+from datetime import datetime, timezone
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from mongomock_motor import AsyncMongoMockClient
+    import mongomock.collection
+except ImportError:
+    sys.exit("bench_matching.py needs mongomock-motor: pip install mongomock-motor")
+
+import db as db_module
+from query_profiler import ProfiledDatabase, profile_queries
+
+# One in-memory database for the whole run, wiped between fixtures. App modules bind
+# `db` at import time, so it is swapped in (wrapped for query counting) before they load.
+_memory = AsyncMongoMockClient()["ridetribe_bench"]
+db_module.db = ProfiledDatabase(_memory)
+
+# pymongo >= 4.11 passes `sort` to bulk update builders, which mongomock does not accept yet
+_add_update = mongomock.collection.BulkOperationBuilder.add_update
+if "sort" not in inspect.signature(_add_update).parameters:
+    mongomock.collection.BulkOperationBuilder.add_update = lambda self, *args, sort=None, **kwargs: _add_update(self, *args, **kwargs)
+
+from matching import find_and_create_matches, find_and_create_matches_bulk
+from peers import calculate_trust_score, refresh_peers
+from synthetic import Scale, generate
+
+def _ints(value: str):
+    return [int(v) for v in value.split(",") if v]
+
+async def _reset_matches():
+    await _memory.matches.delete_many({})
+    await _memory.notifications.delete_many({})
+
+async def _timed(run) -> dict:
+    """Run `run` on a clean match state; time it and count its queries."""
+    await _reset_matches()
+    with profile_queries() as profile:
+        started = time.perf_counter()
+        await run()
+        seconds = time.perf_counter() - started
+    return {"seconds": seconds, "queries": len(profile), "matches": await _memory.matches.count_documents({})}
+
+async def bench_fixture(scale: Scale, args) -> dict:
+    for name in await _memory.list_collection_names():
+        await _memory.drop_collection(name)
+    data = await generate(_memory, scale, seed=args.seed)
+    await refresh_peers(data.user_ids)
+
+    sample = data.schedule_ids[::max(1, len(data.schedule_ids) // args.sample)][:args.sample]
+
+    async def one_at_a_time():
+        for schedule_id in sample:
+            await find_and_create_matches(schedule_id)
+
+    async def bulk():
+        await find_and_create_matches_bulk(data.schedule_ids)
+
+    result = {"scale": scale._asdict(), "schedules": len(data.schedule_ids)}
+    for label, run, count in (("single", one_at_a_time, len(sample)), ("bulk", bulk, len(data.schedule_ids))):
+        runs = [await _timed(run) for _ in range(args.repeat)]
+        best = min(runs, key=lambda r: r["seconds"])
+        result[label] = {
+            "schedules": count,
+            "ms_per_schedule": round(best["seconds"] / count * 1000, 3),
+            "ms_per_schedule_median": round(statistics.median(r["seconds"] for r in runs) / count * 1000, 3),
+            "queries_per_schedule": round(best["queries"] / count, 2),
+            "matches_per_schedule": round(best["matches"] / count, 2),
+        }
+    return result
+
+def bench_trust_score() -> dict:
+    levels = ["direct", "activity-specific", "emergency-only", "unknown"]
+    number = 200000
+    seconds = min(timeit.repeat(lambda: [calculate_trust_score(level) for level in levels], number=number // len(levels), repeat=5))
+    return {"calls": number, "ns_per_call": round(seconds / number * 1e9, 1)}
+
+async def main(args):
+    results = {
+        "benchmark": "matching",
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "users": args.users,
+        "repeat": args.repeat,
+        "calculate_trust_score": bench_trust_score(),
+        "fixtures": [],
+    }
+    print(f"calculate_trust_score: {results['calculate_trust_score']['ns_per_call']} ns/call")
+    print(f"{'tribe':>5} {'sched/user':>10} {'dest/place':>10} | "
+          f"{'single ms/sched':>15} {'queries':>7} | {'bulk ms/sched':>13} {'queries':>7} {'matches':>7}")
+
+    for tribe_size, schedules_per_user, destinations_per_place in itertools.product(
+        args.tribe_sizes, args.schedules_per_user, args.destinations_per_place
+    ):
+        scale = Scale(
+            users=args.users,
+            tribe_size=tribe_size,
+            places=max(1, args.users // 10),
+            destinations_per_place=destinations_per_place,
+            places_per_tribe=args.places_per_tribe,
+            schedules_per_user=schedules_per_user,
+        )
+        fixture = await bench_fixture(scale, args)
+        results["fixtures"].append(fixture)
+        single, bulk = fixture["single"], fixture["bulk"]
+        print(f"{tribe_size:>5} {schedules_per_user:>10} {destinations_per_place:>10} | "
+              f"{single['ms_per_schedule']:>15} {single['queries_per_schedule']:>7} | "
+              f"{bulk['ms_per_schedule']:>13} {bulk['queries_per_schedule']:>7} {bulk['matches_per_schedule']:>7}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--tribe-sizes", type=_ints, default=[5, 20, 50])
+    parser.add_argument("--schedules-per-user", type=_ints, default=[1, 3])
+    parser.add_argument("--destinations-per-place", type=_ints, default=[1, 4])
+    parser.add_argument("--places-per-tribe", type=int, default=3)
+    parser.add_argument("--sample", type=int, default=20, help="Schedules matched one at a time")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    # Fix for Windows asyncio loop policy
+    if os.name == 'nt':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    asyncio.run(main(args))
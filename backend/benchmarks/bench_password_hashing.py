@@ -0,0 +1,75 @@
+"""
+Login throughput under concurrent load: bcrypt inline on the event loop (old
+behaviour) versus the auth password executor.
+
+Each simulated login verifies a bcrypt hash. A heartbeat task ticks every 10 ms;
+its lag shows how long the event loop was blocked, i.e. how long every other
+in-flight request on the worker would have stalled.
+
+Usage (from backend/, with the usual .env):
+    python benchmarks/bench_password_hashing.py --logins 64 --concurrency 16
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auth import get_password_hash, verify_password, verify_password_async, shutdown_password_executor
+from config import settings
+
+HEARTBEAT_INTERVAL = 0.01
+
+async def _heartbeat(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        expected = time.perf_counter() + HEARTBEAT_INTERVAL
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        lags.append(max(0.0, time.perf_counter() - expected))
+
+async def _inline_login(password, hashed):
+    return verify_password(password, hashed)
+
+async def run_mode(mode: str, logins: int, concurrency: int, hashed: str) -> dict:
+    login = _inline_login if mode == "inline" else verify_password_async
+    gate = asyncio.Semaphore(concurrency)
+    lags = []
+    stop = asyncio.Event()
+
+    async def one_login():
+        async with gate:
+            assert await login("password123", hashed)
+
+    heartbeat = asyncio.create_task(_heartbeat(lags, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(one_login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await heartbeat
+
+    lags.sort()
+    return {
+        "mode": mode,
+        "logins": logins,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "logins_per_second": round(logins / elapsed, 2),
+        "loop_lag_p50_ms": round(statistics.median(lags) * 1000, 1) if lags else None,
+        "loop_lag_max_ms": round(lags[-1] * 1000, 1) if lags else None,
+    }
+
+async def main(args):
+    hashed = get_password_hash("password123")
+    print(f"Password pool: {settings.PASSWORD_HASH_WORKERS} workers, "
+          f"limit {settings.PASSWORD_HASH_MAX_CONCURRENCY}")
+    for mode in ("inline", "pool"):
+        print(await run_mode(mode, args.logins, args.concurrency, hashed))
+    shutdown_password_executor()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,153 @@
+"""
+Synthetic RideTribe data for the benchmarks: users grouped into tribes, verified
+destinations shared between several users per place, and schedules clustered
+around the morning school run so that matching has real work to do.
+
+Everything is written straight into the given database with bulk inserts (no API
+calls, no bcrypt per user) and is deterministic for a given seed.
+"""
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple
+from models import UserInDB, TribeInDB, TribeMembershipInDB, DestinationInDB, ScheduleEntryInDB
+from utils import normalize_place_name, place_key
+from geo import geo_point
+
+INSERT_CHUNK = 1000
+TRUST_LEVELS = ("direct", "direct", "activity-specific", "emergency-only")
+RECURRENCES = ("weekly", "weekly", "weekly", "daily", "once")
+
+class Scale(NamedTuple):
+    users: int = 1000
+    tribe_size: int = 20
+    places: int = 0 # 0: one place per 10 users
+    destinations_per_place: int = 2 # Destination documents (by different users) per place
+    places_per_tribe: int = 3 # Places a tribe's schedules are spread over
+    schedules_per_user: int = 2
+
+class SyntheticData(NamedTuple):
+    user_ids: List[str]
+    phones: Dict[str, str] # user id -> phone (the JWT subject)
+    tribe_members: Dict[str, List[str]] # tribe id -> member user ids
+    user_tribe: Dict[str, str]
+    destinations_by_tribe: Dict[str, List[str]] # tribe id -> destination ids its members use
+    schedule_ids: List[str]
+
+def first_school_run(now: datetime) -> datetime:
+    """08:00 UTC on the next Monday, so every generated pickup is inside the matching horizon."""
+    days = (7 - now.weekday()) % 7 or 7
+    return (now + timedelta(days=days)).replace(hour=8, minute=0, second=0, microsecond=0)
+
+def pickup_time(rng: random.Random, base: datetime) -> datetime:
+    return base + timedelta(days=rng.randrange(5), minutes=5 * rng.randint(-6, 6))
+
+async def _insert(collection, documents: List[dict]) -> List[str]:
+    ids = []
+    for start in range(0, len(documents), INSERT_CHUNK):
+        result = await collection.insert_many(documents[start:start + INSERT_CHUNK], ordered=False)
+        ids.extend(str(i) for i in result.inserted_ids)
+    return ids
+
+async def generate(database, scale: Scale, seed: int = 1, password_hash: str = "") -> SyntheticData:
+    """Write a synthetic data set at `scale` into `database` (which should be empty)."""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    base = first_school_run(now)
+    place_count = scale.places or max(1, scale.users // 10)
+
+    # Users
+    phones = [f"9{i:010d}" for i in range(scale.users)]
+    user_ids = await _insert(database.users, [
+        UserInDB(name=f"Parent {i}", phone=phone, hashed_password=password_hash).model_dump(by_alias=True, exclude={"id"})
+        for i, phone in enumerate(phones)
+    ])
+
+    # Tribes: consecutive users, the first one owns the tribe
+    groups = [user_ids[i:i + scale.tribe_size] for i in range(0, len(user_ids), scale.tribe_size)]
+    tribe_ids = await _insert(database.tribes, [
+        TribeInDB(name=f"Tribe {t}", owner_id=members[0], member_count=len(members)).model_dump(by_alias=True, exclude={"id"})
+        for t, members in enumerate(groups)
+    ])
+    tribe_members = dict(zip(tribe_ids, groups))
+    user_tribe = {uid: tid for tid, members in tribe_members.items() for uid in members}
+    await _insert(database.tribe_memberships, [
+        TribeMembershipInDB(
+            tribe_id=tid,
+            user_id=uid,
+            trust_level="direct" if i == 0 else rng.choice(TRUST_LEVELS),
+            status="accepted",
+            invited_by_id=None if i == 0 else members[0]
+        ).model_dump(by_alias=True, exclude={"id"})
+        for tid, members in tribe_members.items()
+        for i, uid in enumerate(members)
+    ])
+
+    # Places and their destination documents, created by members of tribes using the place
+    tribe_places = {tid: rng.sample(range(place_count), min(scale.places_per_tribe, place_count)) for tid in tribe_ids}
+    creators_by_place: Dict[int, List[str]] = {}
+    for tid, places in tribe_places.items():
+        for p in places:
+            creators_by_place.setdefault(p, []).extend(tribe_members[tid])
+
+    destinations = []
+    destination_place = []
+    for p in range(place_count):
+        creators = creators_by_place.get(p) or user_ids
+        geo = {"lat": 37.0 + p * 0.001, "lng": -122.0 - p * 0.001}
+        for _ in range(scale.destinations_per_place):
+            destination = {
+                "name": f"School {p}",
+                "address": f"{p} Synthetic Way",
+                "google_place_id": f"synthetic-{p}",
+                "geo": geo,
+                "category": "school",
+                "verified_date": now,
+                "created_by": rng.choice(creators),
+            }
+            destination["location"] = geo_point(geo)
+            destination["place_key"] = place_key(destination)
+            destinations.append(DestinationInDB(**destination).model_dump(by_alias=True, exclude={"id"}))
+            destination_place.append(p)
+    await _insert(database.places, [
+        {
+            "_id": f"gp:synthetic-{p}",
+            "google_place_id": f"synthetic-{p}",
+            "normalized_name": normalize_place_name(f"School {p}"),
+            "name": f"School {p}",
+            "created_at": now
+        }
+        for p in range(place_count)
+    ])
+    destination_ids = await _insert(database.destinations, destinations)
+    destinations_by_place: Dict[int, List[dict]] = {}
+    for did, doc, p in zip(destination_ids, destinations, destination_place):
+        destinations_by_place.setdefault(p, []).append({**doc, "_id": did})
+    destinations_by_tribe = {
+        tid: [d["_id"] for p in places for d in destinations_by_place[p]]
+        for tid, places in tribe_places.items()
+    }
+
+    # Schedules at the tribe's places
+    schedules = []
+    for uid in user_ids:
+        places = tribe_places[user_tribe[uid]]
+        for c in range(scale.schedules_per_user):
+            destination = rng.choice(destinations_by_place[rng.choice(places)])
+            schedules.append(ScheduleEntryInDB(
+                child_name=f"Child {c}",
+                destination_id=destination["_id"],
+                pickup_time=pickup_time(rng, base),
+                recurrence=rng.choice(RECURRENCES),
+                user_id=uid,
+                place_key=destination["place_key"]
+            ).model_dump(by_alias=True, exclude={"id"}))
+    schedule_ids = await _insert(database.schedules, schedules)
+
+    return SyntheticData(
+        user_ids=user_ids,
+        phones=dict(zip(user_ids, phones)),
+        tribe_members=tribe_members,
+        user_tribe=user_tribe,
+        destinations_by_tribe=destinations_by_tribe,
+        schedule_ids=schedule_ids
+    )
@@ -1,14 +1,60 @@
+import logging
 import os
-import sys
+from typing import Dict, List
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     MONGODB_URI: str
     GOOGLE_MAPS_API_KEY: str = ""
+    GOOGLE_MAPS_BASE_URL: str = "https://maps.googleapis.com/maps/api" # Point at a stub server in tests
+    GOOGLE_MAPS_TIMEOUT_SECONDS: float = 5
+    GOOGLE_MAPS_MAX_RETRIES: int = 2 # Extra attempts on timeouts, 429/5xx and transient API statuses
+    GOOGLE_MAPS_RETRY_BASE_SECONDS: float = 0.2 # Backoff doubles per attempt, with full jitter
+    PLACE_DETAILS_CACHE_TTL_SECONDS: int = 2592000 # 30 days, in-process and in the place_details collection
+    PLACE_DETAILS_CACHE_MAX_SIZE: int = 5000
+    DESTINATION_IMPORT_MAX_ROWS: int = 1000 # Rows accepted per bulk destination import
+    DESTINATION_IMPORT_VERIFY_CONCURRENCY: int = 8 # Place verifications in flight per import
+    SCHEDULE_BULK_MAX_ENTRIES: int = 500 # Schedules accepted per bulk create
+    JOB_QUEUE_INLINE_WORKER: bool = True # Run a job worker in the API process; disable when running worker.py
+    JOB_WORKER_CONCURRENCY: int = 4 # Job batches in flight per worker
+    JOB_POLL_INTERVAL_SECONDS: float = 1 # Idle wait between claims
+    JOB_LEASE_SECONDS: int = 300 # Claimed jobs become claimable again if not renewed within this
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_RETRY_BASE_SECONDS: float = 5 # Backoff doubles per attempt, with jitter
     JWT_SECRET: str = "supersecretkey"
     JWT_ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 1440 # 24 hours
     FRONTEND_URL: str = "http://localhost:5137"
+    INDEX_CHECK_ON_STARTUP: bool = False # Fail boot if a canonical query does a COLLSCAN
+    SCHEDULE_INDEX_ENABLED: bool = False # In-process candidate index; single API worker only
+    OPS_ENDPOINTS_ENABLED: bool = False # Bind the diagnostic endpoints (job stats, schedule index check); they also need a login
+    RECURRENCE_HORIZON_DAYS: int = 28 # How far ahead recurring schedules are compared
+    MATCH_PROXIMITY_RADIUS_METERS: float = 0 # Also match destinations this close; 0 disables
+    MATCH_DEBOUNCE_SECONDS: float = 2 # Re-match requests for a schedule within this window run once
+    USER_CACHE_TTL_SECONDS: int = 60 # Token subject -> user cache used by get_current_user
+    USER_CACHE_MAX_SIZE: int = 10000
+    PASSWORD_HASH_WORKERS: int = 4 # Threads running bcrypt
+    PASSWORD_HASH_MAX_CONCURRENCY: int = 16 # Hashes queued or running at once
+    EVENT_STREAM_QUEUE_SIZE: int = 100 # Buffered push events per connection before dropping
+    EVENT_STREAM_KEEPALIVE_SECONDS: int = 15
+    NOTIFICATION_SINCE_OVERLAP_SECONDS: float = 30 # `since` polls re-send this much history; clients dedupe by _id
+    QUERY_PROFILER_ENABLED: bool = False # Record every query per request with call sites (tests/staging)
+    QUERY_PROFILER_N_PLUS_ONE_THRESHOLD: int = 5 # Same query shape from one call site this often is flagged
+    QUERY_PROFILER_MAX_QUERIES: int = 0 # Default per-request query budget; 0 disables
+    QUERY_PROFILER_ROUTE_BUDGETS: Dict[str, int] = {} # e.g. {"GET /api/v1/tribes/": 4}
+    QUERY_PROFILER_RAISE: bool = False # Fail requests that exceed their budget or hit an N+1 (tests)
+    LOG_LEVEL: str = "INFO"
+    LOG_FILE: str = "" # Also write JSON logs here (from the writer thread); empty for stdout only
+    LOG_QUEUE_SIZE: int = 10000 # Records buffered for the writer thread before dropping
+    LOG_SAMPLED_ROUTES: List[str] = [ # Successful, fast requests to these are logged at LOG_SAMPLE_RATE
+        "/api/v1/healthz",
+        "/metrics",
+        "/api/v1/notifications/",
+        "/api/v1/notifications/unread-count",
+        "/api/v1/matches/"
+    ]
+    LOG_SAMPLE_RATE: float = 0.05
+    LOG_SLOW_REQUEST_SECONDS: float = 1 # Slower requests are always logged
 
     model_config = SettingsConfigDict(
         env_file=os.path.join(os.path.dirname(__file__), ".env"),
@@ -17,9 +63,8 @@ class Settings(BaseSettings):
 
 try:
     settings = Settings()
-    print(f"DEBUG: Settings loaded. FRONTEND_URL={getattr(settings, 'FRONTEND_URL', 'MISSING')}", file=sys.stderr)
 except Exception as e:
-    print(f"DEBUG: Error loading settings: {e}", file=sys.stderr)
+    logging.getLogger(__name__).error(f"Error loading settings: {e}")
     # Fallback to prevent crash during import, but validate later
     class MockSettings:
         FRONTEND_URL = "http://localhost:5137"
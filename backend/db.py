@@ -1,5 +1,10 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 from config import settings
+from metrics import MongoCommandMetrics
 
-client = AsyncIOMotorClient(settings.MONGODB_URI)
-db = client.get_default_database()
\ No newline at end of file
+client = AsyncIOMotorClient(settings.MONGODB_URI, event_listeners=[MongoCommandMetrics()])
+db = client.get_default_database()
+
+if settings.QUERY_PROFILER_ENABLED:
+    from query_profiler import ProfiledDatabase
+    db = ProfiledDatabase(db)
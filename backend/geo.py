@@ -0,0 +1,36 @@
+from typing import List, Optional, Tuple
+from db import db
+
+# Upper bound on nearby destinations considered per source destination
+NEARBY_LIMIT = 200
+
+def geo_point(geo: Optional[dict]) -> Optional[dict]:
+    """
+    GeoJSON point for a destination's {lat, lng}, as stored in `location` and
+    covered by the 2dsphere index. None if coordinates are missing.
+    """
+    if not geo or geo.get("lat") is None or geo.get("lng") is None:
+        return None
+    return {"type": "Point", "coordinates": [geo["lng"], geo["lat"]]}
+
+async def find_nearby_destinations(geo: dict, radius_meters: float, limit: int = NEARBY_LIMIT) -> List[Tuple[dict, float]]:
+    """
+    Destinations within `radius_meters` of `geo`, nearest first, as (document, distance in meters).
+    Uses $geoNear on the destinations.location 2dsphere index.
+    """
+    point = geo_point(geo)
+    if point is None or radius_meters <= 0:
+        return []
+
+    results = await db.destinations.aggregate([
+        {"$geoNear": {
+            "near": point,
+            "key": "location",
+            "distanceField": "distance",
+            "maxDistance": radius_meters,
+            "spherical": True
+        }},
+        {"$limit": limit},
+        {"$project": {"_id": 1, "name": 1, "google_place_id": 1, "place_key": 1, "distance": 1}}
+    ]).to_list(None)
+    return [(d, d["distance"]) for d in results]
@@ -0,0 +1,118 @@
+from typing import Dict, Iterable, List, Optional
+from db import db
+from models import (
+    UserResponse,
+    DestinationResponse,
+    ScheduleEntryResponse,
+    RideMatchResponse
+)
+from utils import to_object_ids
+
+class Hydrator:
+    """
+    Per-request identity map for users, schedules and destinations.
+
+    Ids are collected across a whole result set and each collection is loaded
+    with a single $in query. Documents already seen during the request (found
+    or not) are never fetched again.
+    """
+
+    def __init__(self):
+        self._users: Dict[str, Optional[dict]] = {}
+        self._schedules: Dict[str, Optional[dict]] = {}
+        self._destinations: Dict[str, Optional[dict]] = {}
+
+    async def _load(self, collection, identity_map: Dict[str, Optional[dict]], ids: Iterable):
+        missing = {str(i) for i in ids if i and str(i) not in identity_map}
+        if not missing:
+            return
+        oids = to_object_ids(missing)
+        docs = await collection.find({"_id": {"$in": oids}}).to_list(None) if oids else []
+        for i in missing:
+            identity_map[i] = None
+        for doc in docs:
+            identity_map[str(doc["_id"])] = doc
+
+    @staticmethod
+    def _prime(identity_map: Dict[str, Optional[dict]], docs: Iterable[dict]):
+        for doc in docs:
+            if doc:
+                identity_map[str(doc["_id"])] = doc
+
+    # Priming with documents the caller already holds
+
+    def add_users(self, docs: Iterable[dict]):
+        self._prime(self._users, docs)
+
+    def add_schedules(self, docs: Iterable[dict]):
+        self._prime(self._schedules, docs)
+
+    def add_destinations(self, docs: Iterable[dict]):
+        self._prime(self._destinations, docs)
+
+    # Bulk loading
+
+    async def load_users(self, ids: Iterable):
+        await self._load(db.users, self._users, ids)
+
+    async def load_destinations(self, ids: Iterable):
+        await self._load(db.destinations, self._destinations, ids)
+
+    async def load_schedules(self, ids: Iterable):
+        """Load schedules and the destinations they point to."""
+        ids = list(ids)
+        await self._load(db.schedules, self._schedules, ids)
+        await self.load_destinations(
+            s.get("destination_id") for s in (self._schedules.get(str(i)) for i in ids if i) if s
+        )
+
+    # Lookups (call after the matching load_* method)
+
+    def user_doc(self, user_id) -> Optional[dict]:
+        return self._users.get(str(user_id)) if user_id else None
+
+    def user(self, user_id) -> Optional[UserResponse]:
+        doc = self.user_doc(user_id)
+        return UserResponse(**doc) if doc else None
+
+    def destination_doc(self, destination_id) -> Optional[dict]:
+        return self._destinations.get(str(destination_id)) if destination_id else None
+
+    def destination(self, destination_id) -> Optional[DestinationResponse]:
+        doc = self.destination_doc(destination_id)
+        return DestinationResponse(**doc) if doc else None
+
+    def schedule(self, schedule_id) -> Optional[ScheduleEntryResponse]:
+        doc = self._schedules.get(str(schedule_id)) if schedule_id else None
+        return self.schedule_from_doc(doc) if doc else None
+
+    def schedule_from_doc(self, doc: dict) -> ScheduleEntryResponse:
+        return ScheduleEntryResponse(**doc, destination=self.destination(doc.get("destination_id")))
+
+    # Whole result sets
+
+    async def hydrate_schedules(self, schedules: List[dict]) -> List[ScheduleEntryResponse]:
+        """Build ScheduleEntryResponse objects with their destinations populated."""
+        self.add_schedules(schedules)
+        await self.load_destinations(s.get("destination_id") for s in schedules)
+        return [self.schedule_from_doc(s) for s in schedules]
+
+    async def hydrate_matches(self, matches: List[dict]) -> List[RideMatchResponse]:
+        """Build RideMatchResponse objects with requester, provider and schedule populated."""
+        await self.load_users(
+            uid for m in matches for uid in (m["requester_id"], m["provider_id"])
+        )
+        await self.load_schedules(m["schedule_entry_id"] for m in matches)
+        return [
+            RideMatchResponse(
+                **m,
+                requester=self.user(m["requester_id"]),
+                provider=self.user(m["provider_id"]),
+                schedule=self.schedule(m["schedule_entry_id"])
+            )
+            for m in matches
+        ]
+
+def get_hydrator() -> Hydrator:
+    """FastAPI dependency: one identity map per request."""
+    return Hydrator()
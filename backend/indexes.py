@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, IndexModel
+from pymongo.errors import PyMongoError
+
+# Allow running as a script: python indexes.py [--check]
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from db import db
+
+logger = logging.getLogger(__name__)
+
+# Required indexes per collection. Names are fixed so re-running on boot is a no-op.
+INDEXES = {
+    "users": [
+        IndexModel([("phone", ASCENDING)], name="phone_1", unique=True),
+    ],
+    "tribes": [
+        IndexModel([("owner_id", ASCENDING)], name="owner_id_1"),
+    ],
+    "tribe_memberships": [
+        IndexModel([("tribe_id", ASCENDING), ("user_id", ASCENDING)], name="tribe_id_1_user_id_1"),
+        IndexModel([("user_id", ASCENDING), ("tribe_id", ASCENDING)], name="user_id_1_tribe_id_1"),
+    ],
+    "pending_invites": [
+        IndexModel([("phone", ASCENDING)], name="phone_1"),
+        IndexModel([("tribe_id", ASCENDING)], name="tribe_id_1"),
+    ],
+    "destinations": [
+        IndexModel([("created_by", ASCENDING), ("created_at", DESCENDING)], name="created_by_1_created_at_-1"),
+        IndexModel([("google_place_id", ASCENDING)], name="google_place_id_1"),
+        IndexModel([("name", ASCENDING)], name="name_1"),
+        IndexModel([("place_key", ASCENDING)], name="place_key_1"),
+        # Proximity matching ($geoNear on the GeoJSON point derived from geo)
+        IndexModel([("location", GEOSPHERE)], name="location_2dsphere"),
+    ],
+    "places": [
+        # Name lookup when linking unverified destinations, verified places first
+        IndexModel(
+            [("normalized_name", ASCENDING), ("google_place_id", DESCENDING)],
+            name="normalized_name_1_google_place_id_-1"
+        ),
+    ],
+    "schedules": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_id_1_created_at_-1"),
+        IndexModel(
+            [("user_id", ASCENDING), ("status", ASCENDING), ("pickup_time", ASCENDING)],
+            name="user_id_1_status_1_pickup_time_1"
+        ),
+        # Matching: equality on place/status, range on pickup_time
+        IndexModel(
+            [("place_key", ASCENDING), ("status", ASCENDING), ("pickup_time", ASCENDING)],
+            name="place_key_1_status_1_pickup_time_1"
+        ),
+        # Destination updates: active schedules of one destination
+        IndexModel(
+            [("destination_id", ASCENDING), ("status", ASCENDING), ("pickup_time", ASCENDING)],
+            name="destination_id_1_status_1_pickup_time_1"
+        ),
+    ],
+    "matches": [
+        IndexModel([("requester_id", ASCENDING), ("created_at", DESCENDING)], name="requester_id_1_created_at_-1"),
+        IndexModel([("provider_id", ASCENDING), ("created_at", DESCENDING)], name="provider_id_1_created_at_-1"),
+        IndexModel([("schedule_entry_id", ASCENDING)], name="schedule_entry_id_1"),
+        IndexModel([("provider_schedule_id", ASCENDING)], name="provider_schedule_id_1"),
+        # Rejects a second match for the same schedule pair from a concurrent matching pass
+        IndexModel(
+            [("pair_key", ASCENDING)],
+            name="pair_key_1",
+            unique=True,
+            partialFilterExpression={"pair_key": {"$type": "string"}}
+        ),
+    ],
+    "jobs": [
+        # At most one pending job per dedupe key
+        IndexModel(
+            [("dedupe_key", ASCENDING)],
+            name="dedupe_key_1_pending",
+            unique=True,
+            partialFilterExpression={"status": "pending", "dedupe_key": {"$type": "string"}}
+        ),
+        # At most one running job per dedupe key (per-key serialization)
+        IndexModel(
+            [("dedupe_key", ASCENDING)],
+            name="dedupe_key_1_running",
+            unique=True,
+            partialFilterExpression={"status": "running", "dedupe_key": {"$type": "string"}}
+        ),
+        IndexModel([("status", ASCENDING), ("run_at", ASCENDING)], name="status_1_run_at_1"),
+        IndexModel([("status", ASCENDING), ("lease_until", ASCENDING)], name="status_1_lease_until_1"),
+        IndexModel([("lease_owner", ASCENDING)], name="lease_owner_1"),
+    ],
+    "notifications": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_id_1_created_at_-1"),
+        IndexModel([("user_id", ASCENDING), ("is_read", ASCENDING)], name="user_id_1_is_read_1"),
+    ],
+}
+
+# Canonical hot-path query per router, used by check mode.
+# Values are placeholders; the planner picks the same index regardless.
+_SAMPLE_ID = "000000000000000000000000"
+_SAMPLE_TIME = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+CANONICAL_QUERIES = [
+    ("auth.get_current_user", "users", {"phone": "00000000000"}),
+    ("tribes.list_tribes", "tribe_memberships", {"user_id": _SAMPLE_ID}),
+    ("tribes.list_tribe_members", "tribe_memberships", {"tribe_id": _SAMPLE_ID}),
+    ("tribes.invite_member", "tribe_memberships", {"tribe_id": _SAMPLE_ID, "user_id": _SAMPLE_ID}),
+    ("auth.signup", "pending_invites", {"phone": "00000000000"}),
+    ("destinations.list_destinations", "destinations", {"created_by": _SAMPLE_ID, "is_archived": {"$ne": True}}),
+    ("places.resolve_place_key", "places", {"normalized_name": "sample"}),
+    ("schedules.list_schedules", "schedules", {"user_id": _SAMPLE_ID}),
+    ("matching.candidates", "schedules", {
+        "user_id": {"$in": [_SAMPLE_ID]},
+        "place_key": "gp:sample",
+        "pickup_time": {"$gte": _SAMPLE_TIME, "$lte": _SAMPLE_TIME},
+        "status": "active"
+    }),
+    ("destinations.update_destination", "schedules", {"destination_id": _SAMPLE_ID, "status": "active"}),
+    ("matches.list_matches", "matches", {"$or": [{"requester_id": _SAMPLE_ID}, {"provider_id": _SAMPLE_ID}]}),
+    ("matching.invalidate_schedule_matches_bulk", "matches", {
+        "$or": [{"schedule_entry_id": {"$in": [_SAMPLE_ID]}}, {"provider_schedule_id": {"$in": [_SAMPLE_ID]}}]
+    }),
+    ("notifications.list_notifications", "notifications", {"user_id": _SAMPLE_ID}),
+]
+
+async def ensure_indexes(database=None):
+    """
+    Create all required indexes. Safe to call on every boot: existing indexes with
+    the same name and spec are left untouched. A failure on one collection is logged
+    and does not prevent the others from being created.
+    """
+    database = database if database is not None else db
+    for collection_name, models in INDEXES.items():
+        try:
+            created = await database[collection_name].create_indexes(models)
+            logger.info(f"Indexes ensured on {collection_name}: {created}")
+        except PyMongoError as e:
+            logger.error(f"Failed to create indexes on {collection_name}: {e}")
+
+def _plan_stages(plan):
+    """Yield every stage name in an explain() plan tree."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+async def check_query_plans(database=None):
+    """
+    Run explain() on each canonical query and raise RuntimeError listing every
+    query whose winning plan contains a COLLSCAN.
+    """
+    database = database if database is not None else db
+    failures = []
+    for label, collection_name, query in CANONICAL_QUERIES:
+        explanation = await database[collection_name].find(query).explain()
+        winning_plan = explanation.get("queryPlanner", {}).get("winningPlan", {})
+        if "COLLSCAN" in set(_plan_stages(winning_plan)):
+            failures.append(f"{label} ({collection_name}: {query})")
+        else:
+            logger.info(f"Query plan OK: {label}")
+
+    if failures:
+        raise RuntimeError("COLLSCAN detected for: " + "; ".join(failures))
+
+async def main(check: bool):
+    await ensure_indexes()
+    if check:
+        await check_query_plans()
+        print("All canonical queries use an index.")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    # Fix for Windows asyncio loop policy
+    if os.name == 'nt':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    asyncio.run(main(check="--check" in sys.argv))
@@ -0,0 +1,252 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from config import settings
+from db import db
+from metrics import time_job_batch
+
+logger = logging.getLogger(__name__)
+
+# Durable job queue on the `jobs` collection.
+#
+# jobs document: {_id, type, payload, dedupe_key, status ("pending" | "running" | "failed"),
+#                 attempts, run_at, lease_owner, lease_until, last_error, created_at}
+#
+# Enqueueing a job whose dedupe_key matches a pending job is a no-op, and a job is not
+# claimed while another job with its dedupe_key is running (partial unique indexes back
+# both). Workers claim due jobs by taking a lease; a job whose worker dies becomes
+# claimable again once its lease expires. Finished jobs are deleted; jobs that
+# run out of attempts stay behind as "failed" for inspection.
+
+class JobType(NamedTuple):
+    handler: Callable[[List[dict]], Awaitable[None]]
+    batch_size: int # Jobs of this type handed to one handler call
+
+_job_types: Dict[str, JobType] = {}
+
+def job_handler(job_type: str, batch_size: int = 1):
+    """
+    Register an async handler for a job type. The handler receives the payloads of
+    up to `batch_size` claimed jobs; raising fails (and retries) the whole batch.
+    """
+    def decorator(func):
+        _job_types[job_type] = JobType(func, batch_size)
+        return func
+    return decorator
+
+async def enqueue(job_type: str, payloads: Iterable[dict], dedupe_keys: Optional[Iterable[str]] = None, delay_seconds: float = 0):
+    """
+    Add jobs in one bulk write. Jobs with a dedupe key already pending are skipped.
+    """
+    payloads = list(payloads)
+    if not payloads:
+        return
+    keys = list(dedupe_keys) if dedupe_keys is not None else [None] * len(payloads)
+    now = datetime.now(timezone.utc)
+    run_at = now + timedelta(seconds=delay_seconds)
+
+    operations = []
+    for payload, key in zip(payloads, keys):
+        job = {
+            "type": job_type,
+            "payload": payload,
+            "dedupe_key": key,
+            "attempts": 0,
+            "run_at": run_at,
+            "lease_owner": None,
+            "lease_until": None,
+            "last_error": None,
+            "created_at": now
+        }
+        if key is None:
+            operations.append(UpdateOne({"_id": ObjectId()}, {"$setOnInsert": {**job, "status": "pending"}}, upsert=True))
+        else:
+            operations.append(UpdateOne({"dedupe_key": key, "status": "pending"}, {"$setOnInsert": job}, upsert=True))
+
+    try:
+        await db.jobs.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        # A concurrent enqueue won the race for the same pending dedupe key
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+
+async def queue_stats() -> dict:
+    """Queue depth per job type and status, plus the age of the oldest due job."""
+    now = datetime.now(timezone.utc)
+    counts = await db.jobs.aggregate([
+        {"$group": {"_id": {"type": "$type", "status": "$status"}, "count": {"$sum": 1}}}
+    ]).to_list(None)
+    by_type: Dict[str, Dict[str, int]] = {}
+    for row in counts:
+        by_type.setdefault(row["_id"]["type"], {})[row["_id"]["status"]] = row["count"]
+
+    oldest = await db.jobs.find_one({"status": "pending", "run_at": {"$lte": now}}, sort=[("run_at", 1)])
+    oldest_age = None
+    if oldest:
+        run_at = oldest["run_at"]
+        if run_at.tzinfo is None:
+            run_at = run_at.replace(tzinfo=timezone.utc)
+        oldest_age = round((now - run_at).total_seconds(), 3)
+    return {"jobs": by_type, "oldest_due_seconds": oldest_age}
+
+class JobWorker:
+    """
+    Claims due jobs and runs them with at most `concurrency` batches in flight.
+    Runs either inside the API process (JOB_QUEUE_INLINE_WORKER) or standalone via worker.py.
+    """
+
+    def __init__(self, concurrency: Optional[int] = None, worker_id: Optional[str] = None):
+        self.concurrency = concurrency or settings.JOB_WORKER_CONCURRENCY
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._stopping = asyncio.Event()
+        self._running = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Run the worker loop as a background task of the current event loop."""
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stop claiming and wait for in-flight batches (their leases cover a crash here)."""
+        self._stopping.set()
+        if self._task:
+            await self._task
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def run(self):
+        logger.info(f"Job worker {self.worker_id} started (concurrency {self.concurrency})")
+        while not self._stopping.is_set():
+            await self._slots.acquire()
+            try:
+                claimed = await self._claim()
+            except Exception as e:
+                logger.error(f"Job worker {self.worker_id} failed to claim jobs: {e}")
+                claimed = None
+            if not claimed:
+                self._slots.release()
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=settings.JOB_POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            task = asyncio.create_task(self._run_batch(*claimed))
+            self._running.add(task)
+            task.add_done_callback(self._batch_done)
+        logger.info(f"Job worker {self.worker_id} stopped")
+
+    def _batch_done(self, task):
+        self._running.discard(task)
+        self._slots.release()
+
+    async def drain(self):
+        """Run due jobs until none are left (tests, benchmarks and scripts)."""
+        while True:
+            claimed = await self._claim()
+            if not claimed:
+                return
+            await self._run_batch(*claimed)
+
+    def _due_filter(self, now: datetime) -> dict:
+        return {
+            "type": {"$in": list(_job_types)},
+            "$or": [
+                {"status": "pending", "run_at": {"$lte": now}},
+                {"status": "running", "lease_until": {"$lt": now}}
+            ]
+        }
+
+    async def _claim(self):
+        """
+        Lease up to one batch of due jobs of a single type; returns (type, jobs, lease_owner) or None.
+        A job whose dedupe key is already running elsewhere is skipped (the partial unique
+        index on running keys rejects its claim), so work per key is serialized.
+        """
+        now = datetime.now(timezone.utc)
+        due = self._due_filter(now)
+
+        # The oldest due job picks the type
+        first = await db.jobs.find_one(due, {"type": 1}, sort=[("run_at", 1)])
+        if not first:
+            return None
+        job_type = _job_types[first["type"]]
+        candidates = await db.jobs.find(
+            {**due, "type": first["type"]},
+            {"_id": 1}
+        ).sort("run_at", 1).limit(job_type.batch_size).to_list(None)
+
+        # Each claim succeeds or fails on its own; read back the ones we got
+        lease_owner = f"{self.worker_id}:{uuid.uuid4().hex}"
+        lease = {
+            "status": "running",
+            "lease_owner": lease_owner,
+            "lease_until": now + timedelta(seconds=settings.JOB_LEASE_SECONDS)
+        }
+        try:
+            await db.jobs.bulk_write(
+                [UpdateOne({**due, "_id": c["_id"]}, {"$set": lease}) for c in candidates],
+                ordered=False
+            )
+        except BulkWriteError as e:
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+        jobs = await db.jobs.find({"lease_owner": lease_owner}).to_list(None)
+        if not jobs:
+            return None
+        return first["type"], jobs, lease_owner
+
+    async def _run_batch(self, type_name: str, jobs: List[dict], lease_owner: str):
+        # Every write below is conditional on still holding the lease: if it expired and
+        # another worker reclaimed the jobs, they are that worker's to renew, finish or retry
+        ids = [j["_id"] for j in jobs]
+        heartbeat = asyncio.create_task(self._heartbeat(ids, lease_owner))
+        try:
+            with time_job_batch(type_name):
+                await _job_types[type_name].handler([j["payload"] for j in jobs])
+        except Exception as e:
+            logger.exception(f"Job batch {type_name} ({len(jobs)} jobs) failed")
+            await self._retry(jobs, lease_owner, e)
+        else:
+            await db.jobs.delete_many({"_id": {"$in": ids}, "lease_owner": lease_owner})
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, ids: list, lease_owner: str):
+        """Extend the lease while a long batch is still running."""
+        while True:
+            await asyncio.sleep(settings.JOB_LEASE_SECONDS / 3)
+            await db.jobs.update_many(
+                {"_id": {"$in": ids}, "status": "running", "lease_owner": lease_owner},
+                {"$set": {"lease_until": datetime.now(timezone.utc) + timedelta(seconds=settings.JOB_LEASE_SECONDS)}}
+            )
+
+    async def _retry(self, jobs: List[dict], lease_owner: str, error: Exception):
+        """Reschedule with jittered exponential backoff, or mark failed after JOB_MAX_ATTEMPTS."""
+        now = datetime.now(timezone.utc)
+        operations = []
+        for job in jobs:
+            attempts = job.get("attempts", 0) + 1
+            update = {"attempts": attempts, "last_error": repr(error), "lease_owner": None, "lease_until": None}
+            if attempts >= settings.JOB_MAX_ATTEMPTS:
+                update["status"] = "failed"
+            else:
+                delay = settings.JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+                update["status"] = "pending"
+                update["run_at"] = now + timedelta(seconds=random.uniform(delay / 2, delay))
+            operations.append(UpdateOne({"_id": job["_id"], "lease_owner": lease_owner}, {"$set": update}))
+        try:
+            await db.jobs.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # A fresh pending job with the same dedupe key already exists; it supersedes the retry
+            dupes = [err["op"]["q"]["_id"] for err in e.details.get("writeErrors", []) if err.get("code") == 11000]
+            if dupes:
+                await db.jobs.delete_many({"_id": {"$in": dupes}, "lease_owner": lease_owner})
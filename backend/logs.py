@@ -0,0 +1,132 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+from config import settings
+import metrics
+
+# Structured JSON logging that never blocks the event loop. Callers only format the
+# message and put the record on a bounded queue; a listener thread serializes it and
+# does the (possibly slow) writes. When the queue is full records are dropped and
+# counted rather than making the request wait.
+
+REQUEST_ID_HEADER = "X-Request-ID"
+_UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+log_records_dropped_total = metrics.Counter("log_records_dropped_total", "Log records dropped because the log queue was full")
+
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,64}$")
+
+# LogRecord attributes that are not user-supplied `extra` fields (uvicorn adds an ANSI `color_message`)
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id", "color_message"}
+
+def get_request_id() -> Optional[str]:
+    return _request_id.get()
+
+def bind_request_id(incoming: Optional[str] = None) -> str:
+    """
+    Set the correlation id for the current request: the caller's X-Request-ID when it
+    looks sane, otherwise a fresh one. Returns the id to echo back.
+    """
+    request_id = incoming if incoming and _VALID_REQUEST_ID.match(incoming) else uuid.uuid4().hex
+    _request_id.set(request_id)
+    return request_id
+
+def should_sample(route: str) -> bool:
+    """Whether to log an uneventful request to `route` (errors and slow requests are always logged)."""
+    if route not in settings.LOG_SAMPLED_ROUTES:
+        return True
+    return random.random() < settings.LOG_SAMPLE_RATE
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `extra={...}` fields are included as top-level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Runs in the caller's thread (it must, to read the request id contextvar): stamps
+    the request id and hands off without blocking. The listener thread serializes and writes.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve everything that depends on caller state now; serialization happens in the listener
+        record.request_id = _request_id.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_dropped_total.inc()
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def configure_logging():
+    """Route the root and uvicorn loggers through the queue. Safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = JsonFormatter()
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if settings.LOG_FILE:
+        handlers.append(logging.FileHandler(settings.LOG_FILE))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_QueueHandler(log_queue))
+    root.setLevel(settings.LOG_LEVEL.upper())
+    # Uvicorn installs its own stdout handlers; send its loggers through the queue too
+    for name in _UVICORN_LOGGERS:
+        uvicorn_logger = logging.getLogger(name)
+        for handler in list(uvicorn_logger.handlers):
+            uvicorn_logger.removeHandler(handler)
+        uvicorn_logger.propagate = True
+    # The log_requests middleware writes the access record; uvicorn's would duplicate it
+    logging.getLogger("uvicorn.access").disabled = True
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,37 +1,106 @@
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Depends, Request, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.exceptions import HTTPException as StarletteHTTPException
 import logging
 import time
 from db import db
 from config import settings
+from auth import get_current_user, user_cache, shutdown_password_executor
+from indexes import ensure_indexes, check_query_plans
+from jobs import JobWorker, queue_stats
+from logs import configure_logging, bind_request_id, should_sample, REQUEST_ID_HEADER
+import metrics
+from pagination import NEXT_CURSOR_HEADER, LATEST_CURSOR_HEADER
+from schedule_index import schedule_index
+from services.google_maps import place_details_cache, start_client as start_maps_client, close_client as close_maps_client
 from routers import auth, destinations, tribes, schedules, matches, notifications
 
 app = FastAPI()
 
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler("backend_requests.log")
-    ]
-)
+configure_logging()
 logger = logging.getLogger(__name__)
 
+def _route_template(request: Request) -> str:
+    """Label by route template (e.g. /api/v1/tribes/{tribe_id}/invite), not the raw path."""
+    if request.scope.get("route") is None:
+        return "unmatched" # 404s would otherwise add one label per probed URL
+    path = request.url.path
+    for name, value in request.path_params.items():
+        path = path.replace(f"/{value}", f"/{{{name}}}", 1)
+    return path
+
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    start_time = time.time()
-    logger.info(f"Incoming request: {request.method} {request.url}")
+    # Everything logged while handling the request carries this id
+    request_id = bind_request_id(request.headers.get(REQUEST_ID_HEADER))
+    start_time = time.perf_counter()
     try:
         response = await call_next(request)
-        process_time = time.time() - start_time
-        logger.info(f"Request handled: {request.method} {request.url} - Status: {response.status_code} - Time: {process_time:.4f}s")
+    except Exception:
+        logger.exception("Request failed", extra={"method": request.method, "path": request.url.path, "route": _route_template(request)})
+        raise
+    elapsed = time.perf_counter() - start_time
+    route = _route_template(request)
+    if response.status_code >= 400 or elapsed >= settings.LOG_SLOW_REQUEST_SECONDS or should_sample(route):
+        logger.log(
+            logging.ERROR if response.status_code >= 500 else logging.INFO,
+            "Request handled",
+            extra={
+                "method": request.method,
+                "path": request.url.path,
+                "route": route,
+                "status": response.status_code,
+                "duration_ms": round(elapsed * 1000, 2)
+            }
+        )
+    response.headers[REQUEST_ID_HEADER] = request_id
+    return response
+
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    method = request.method
+    metrics.http_requests_in_flight.inc(method=method)
+    start_time = time.perf_counter()
+    status_code = 500
+    with metrics.track_unit() as unit:
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            return response
+        finally:
+            route_path = _route_template(request)
+            elapsed = time.perf_counter() - start_time
+            metrics.http_requests_in_flight.dec(method=method)
+            metrics.http_requests_total.inc(method=method, route=route_path, status=status_code)
+            metrics.http_request_duration_seconds.observe(elapsed, method=method, route=route_path)
+            unit.finish(f"{method} {route_path}")
+
+if settings.QUERY_PROFILER_ENABLED:
+    from query_profiler import profile_queries, QueryBudgetExceeded
+
+    @app.middleware("http")
+    async def profile_request_queries(request: Request, call_next):
+        with profile_queries() as profile:
+            response = await call_next(request)
+        route = f"{request.method} {_route_template(request)}"
+        budget = settings.QUERY_PROFILER_ROUTE_BUDGETS.get(route, settings.QUERY_PROFILER_MAX_QUERIES)
+        over_budget = budget > 0 and len(profile) > budget
+        n_plus_one = profile.n_plus_one(settings.QUERY_PROFILER_N_PLUS_ONE_THRESHOLD)
+        if over_budget or n_plus_one:
+            logger.warning(
+                "Query profile flagged",
+                extra={
+                    "route": route,
+                    "queries": len(profile),
+                    "budget": budget,
+                    "n_plus_one": [n._asdict() for n in n_plus_one]
+                }
+            )
+            if settings.QUERY_PROFILER_RAISE:
+                problem = f"{len(profile)} queries (budget {budget})" if over_budget else "N+1 query pattern"
+                raise QueryBudgetExceeded(f"{route}: {problem}\n{profile.report()}")
+        response.headers["X-Query-Count"] = str(len(profile))
         return response
-    except Exception as e:
-        logger.error(f"Request failed: {request.method} {request.url} - Error: {str(e)}")
-        raise e
 
 # Debug settings issue
 try:
@@ -61,6 +130,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, LATEST_CURSOR_HEADER, REQUEST_ID_HEADER],
 )
 
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["auth"])
@@ -70,6 +140,25 @@ app.include_router(schedules.router, prefix="/api/v1/schedules", tags=["schedule
 app.include_router(matches.router, prefix="/api/v1/matches", tags=["matches"])
 app.include_router(notifications.router, prefix="/api/v1/notifications", tags=["notifications"])
 
+@app.on_event("startup")
+async def startup():
+    await ensure_indexes()
+    if settings.INDEX_CHECK_ON_STARTUP:
+        await check_query_plans()
+    if settings.SCHEDULE_INDEX_ENABLED:
+        await schedule_index.warm()
+    start_maps_client()
+    if settings.JOB_QUEUE_INLINE_WORKER:
+        app.state.job_worker = JobWorker()
+        app.state.job_worker.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    if getattr(app.state, "job_worker", None):
+        await app.state.job_worker.stop()
+    shutdown_password_executor()
+    await close_maps_client()
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Magical Bear Wag API"}
@@ -79,10 +168,37 @@ async def health_check():
     try:
         # Attempt a simple DB operation to verify connectivity
         await db.list_collection_names()
-        return {"status": "ok", "db": "connected"}
+        return {"status": "ok", "db": "connected", "user_cache": user_cache.stats(), "place_details_cache": place_details_cache.stats()}
     except Exception as e:
         return {"status": "error", "db": "disconnected", "detail": str(e)}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Prometheus text exposition of this process's metrics."""
+    try:
+        stats = await queue_stats()
+        metrics.jobs_queued.clear()
+        for job_type, counts in stats["jobs"].items():
+            for job_status, count in counts.items():
+                metrics.jobs_queued.set(count, type=job_type, status=job_status)
+    except Exception as e:
+        logger.error(f"Failed to sample job queue for metrics: {e}")
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+if settings.OPS_ENDPOINTS_ENABLED:
+    @app.get("/api/v1/jobs/stats", dependencies=[Depends(get_current_user)])
+    async def job_queue_stats():
+        """Job queue depth per type and status (also exported by /metrics as jobs_queued)."""
+        return await queue_stats()
+
+    @app.get("/api/v1/schedule_index/check", dependencies=[Depends(get_current_user)])
+    async def schedule_index_check():
+        """Compare the in-process schedule index against Mongo (rebuilds it from every active schedule)."""
+        if not schedule_index.ready:
+            return {"status": "disabled"}
+        report = await schedule_index.check_consistency()
+        return {"status": "ok" if report["consistent"] else "drift", **report}
+
 @app.get("/api/v1/test_db_write")
 async def test_db_write():
     try:
@@ -108,4 +224,4 @@ async def get_version():
 logger.info("MAIN.PY RELOADED - VERSION 7")
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=False)
\ No newline at end of file
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=False, access_log=False)
\ No newline at end of file
@@ -1,224 +1,367 @@
-from datetime import datetime, timedelta
-from bson import ObjectId
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+from pymongo.errors import BulkWriteError
+from config import settings
 from db import db
+from geo import find_nearby_destinations
+from jobs import enqueue, job_handler
 from models import RideMatchInDB, NotificationInDB
+from peers import calculate_trust_score, load_peer_scores  # noqa: F401  (calculate_trust_score re-exported)
+from places import destination_place_key
+from recurrence import RECURRENCE_STEPS, first_overlap, is_recurring
+from schedule_index import schedule_index
+from services.notifications import create_notifications
+from utils import as_utc, to_object_ids
 
-def calculate_trust_score(trust_level: str) -> int:
-    if trust_level == "direct":
-        return 100
-    elif trust_level == "activity-specific":
-        return 80
-    elif trust_level == "emergency-only":
-        return 60
-    return 50
+# Schedules matched per pass; larger batches are split to keep the $or query bounded
+MATCH_BATCH_SIZE = 200
+
+async def enqueue_matching(schedule_ids: List[str]):
+    """
+    Queue a matching pass for each schedule. Jobs wait MATCH_DEBOUNCE_SECONDS and a
+    schedule already waiting is not queued twice, so a burst of edits collapses into
+    one pass; a schedule is never matched by two workers at once (see jobs._claim).
+    Workers pick queued schedules up in batches.
+    """
+    ids = list(dict.fromkeys(str(sid) for sid in schedule_ids))
+    await enqueue(
+        "match_schedules",
+        ({"schedule_id": sid} for sid in ids),
+        dedupe_keys=(f"match:{sid}" for sid in ids),
+        delay_seconds=settings.MATCH_DEBOUNCE_SECONDS
+    )
+
+@job_handler("match_schedules", batch_size=MATCH_BATCH_SIZE)
+async def _run_matching_jobs(payloads: List[dict]):
+    await find_and_create_matches_bulk([p["schedule_id"] for p in payloads])
 
 async def find_and_create_matches(schedule_id: str):
     """
     Background task to find matching schedules for a new schedule entry.
     """
-    # 1. Get the new schedule
-    new_schedule = await db.schedules.find_one({"_id": ObjectId(schedule_id)})
-    if not new_schedule:
-        return
+    await find_and_create_matches_bulk([schedule_id])
 
-    user_id = new_schedule["user_id"]
-    # Convert string user_id to ObjectId for user lookup
-    try:
-        user_oid = ObjectId(user_id)
-    except:
-        return
+async def find_and_create_matches_bulk(schedule_ids: List[str]):
+    """
+    Background task to find matching schedules for a batch of schedule entries.
+    Every lookup is a single $in query per collection for the whole batch, existing
+    matches are deduplicated in memory and writes go out with insert_many.
+    """
+    unique_ids = list(dict.fromkeys(str(sid) for sid in schedule_ids))
+    for start in range(0, len(unique_ids), MATCH_BATCH_SIZE):
+        await _match_batch(unique_ids[start:start + MATCH_BATCH_SIZE])
 
-    requester_user = await db.users.find_one({"_id": user_oid})
-    if not requester_user:
-        print(f"Requester user {user_id} not found")
+async def _match_batch(schedule_ids: List[str]):
+    # 1. Get the new schedules (only those with a pickup time can match)
+    new_schedules = await db.schedules.find({"_id": {"$in": to_object_ids(schedule_ids)}}).to_list(None)
+    new_schedules = [s for s in new_schedules if s.get("pickup_time")]
+    if not new_schedules:
         return
-    destination_id = new_schedule["destination_id"]
-    pickup_time = new_schedule.get("pickup_time")
-    
-    if not pickup_time:
+
+    # Requesters must exist
+    requester_ids = {s["user_id"] for s in new_schedules}
+    requesters = await db.users.find({"_id": {"$in": to_object_ids(requester_ids)}}).to_list(None)
+    user_names = {str(u["_id"]): u["name"] for u in requesters}
+    new_schedules = [s for s in new_schedules if s["user_id"] in user_names]
+    if not new_schedules:
         return
 
-    # Fetch destination to check for google_place_id
-    destination = await db.destinations.find_one({"_id": ObjectId(destination_id)})
-    if not destination:
-        print(f"Destination {destination_id} not found")
+    # 2. Potential partners per requester with their best trust score (materialized peer graph)
+    partner_scores = await load_peer_scores(requester_ids)
+
+    # 3. Find matching schedules from partners
+    # Criteria per new schedule:
+    # - Same canonical place (or within MATCH_PROXIMITY_RADIUS_METERS when enabled)
+    # - Some occurrence within +/- 15 minutes of one of ours (within the recurrence horizon)
+    # - Status active
+    time_window = timedelta(minutes=15)
+    new_schedules = [s for s in new_schedules if partner_scores.get(s["user_id"])]
+    if not new_schedules:
         return
 
-    # Find all compatible destination IDs (same place)
-    target_destination_ids = [destination_id]
-    
-    if destination.get("google_place_id"):
-        # 1. Try matching by Google Place ID
-        same_place_dests = await db.destinations.find({
-            "google_place_id": destination["google_place_id"]
-        }).to_list(100)
-        target_destination_ids = [str(d["_id"]) for d in same_place_dests]
+    horizon = _Horizon(time_window)
+    keys_by_schedule = await _target_place_keys(new_schedules)
+    new_schedules = [s for s in new_schedules if str(s["_id"]) in keys_by_schedule]
+    if not new_schedules:
+        return
+    if settings.SCHEDULE_INDEX_ENABLED and schedule_index.ready:
+        candidates_by_schedule = _find_candidates_indexed(new_schedules, keys_by_schedule, partner_scores, horizon)
     else:
-        # 2. Fallback: Match by Name (for manual entries or when Place ID is missing)
-        # This allows "School" matches even if created manually by different users
-        same_place_dests = await db.destinations.find({
-            "name": destination["name"]
-        }).to_list(100)
-        target_destination_ids = [str(d["_id"]) for d in same_place_dests]
-
-    # 2. Find tribes the user belongs to
-    user_memberships = await db.tribe_memberships.find({"user_id": user_id}).to_list(100)
-    tribe_ids = [m["tribe_id"] for m in user_memberships]
-    
-    if not tribe_ids:
+        candidates_by_schedule = await _find_candidates_mongo(new_schedules, keys_by_schedule, partner_scores, horizon)
+    if not candidates_by_schedule:
         return
 
-    # 3. Find other members in these tribes (potential providers/peers)
-    # We want unique user IDs that are NOT the current user
-    # tribe_id is stored as string in memberships
-    tribe_memberships = await db.tribe_memberships.find({
-        "tribe_id": {"$in": tribe_ids},
-        "user_id": {"$ne": user_id}
-    }).to_list(1000)
-    
-    potential_partner_ids = list(set([m["user_id"] for m in tribe_memberships]))
-    
-    if not potential_partner_ids:
+    # Existing matches touching this batch, checked in both directions
+    batch_ids = [str(s["_id"]) for s in new_schedules]
+    existing = await db.matches.find({
+        "$or": [
+            {"schedule_entry_id": {"$in": batch_ids}},
+            {"provider_schedule_id": {"$in": batch_ids}}
+        ]
+    }).to_list(None)
+    seen_pairs = set()
+    for m in existing:
+        seen_pairs.add((m["requester_id"], m["provider_id"], m["schedule_entry_id"], m.get("provider_schedule_id")))
+
+    # 4. Build match records (candidates are ordered nearest first)
+    proximity_enabled = settings.MATCH_PROXIMITY_RADIUS_METERS > 0
+    new_matches = []
+    for s in new_schedules:
+        schedule_id = str(s["_id"])
+        user_id = s["user_id"]
+        partners = partner_scores[user_id]
+
+        for match_schedule, distance in candidates_by_schedule.get(schedule_id, ()):
+            provider_id = match_schedule["user_id"]
+            provider_schedule_id = str(match_schedule["_id"])
+            forward = (user_id, provider_id, schedule_id, provider_schedule_id)
+            reverse = (provider_id, user_id, provider_schedule_id, schedule_id)
+            if forward in seen_pairs or reverse in seen_pairs:
+                continue
+            seen_pairs.add(forward)
+
+            new_matches.append(RideMatchInDB(
+                requester_id=user_id,
+                provider_id=provider_id,
+                schedule_entry_id=schedule_id,
+                provider_schedule_id=provider_schedule_id,
+                match_score=partners[provider_id],
+                distance_meters=round(distance, 1) if proximity_enabled else None,
+                pair_key=":".join(sorted((schedule_id, provider_schedule_id))),
+                status="suggested"
+            ))
+
+    if not new_matches:
         return
 
-    # 4. Find matching schedules from these partners
-    # Criteria:
-    # - Same destination
-    # - Pickup time within +/- 15 minutes
-    # - Status active
-    
-    time_window = timedelta(minutes=15)
-    min_time = pickup_time - time_window
-    max_time = pickup_time + time_window
-    
-    matching_schedules = await db.schedules.find({
-        "user_id": {"$in": potential_partner_ids},
-        "destination_id": {"$in": target_destination_ids},
-        "pickup_time": {"$gte": min_time, "$lte": max_time},
-        "status": "active"
-    }).to_list(100)
-    
-    # 5. Create Match records
-    for match_schedule in matching_schedules:
-        # Check if match already exists to avoid duplicates
-        # We check both directions to ensure we don't create duplicate pairings for the same event
-        existing_match = await db.matches.find_one({
-            "$or": [
-                {
-                    "requester_id": user_id, 
-                    "provider_id": match_schedule["user_id"], 
-                    "schedule_entry_id": schedule_id,
-                    "provider_schedule_id": str(match_schedule["_id"])
-                },
-                {
-                    "requester_id": match_schedule["user_id"], 
-                    "provider_id": user_id, 
-                    "schedule_entry_id": str(match_schedule["_id"]),
-                    "provider_schedule_id": str(schedule_id)
-                }
-            ]
-        })
-        
-        if existing_match:
-            continue
-            
-        # Calculate Trust Score
-        provider_id = match_schedule["user_id"]
-        # Find membership for this provider in the tribes we are looking at
-        # We want the highest trust level if multiple exist
-        trust_score = 50
-        for m in tribe_memberships:
-            if m["user_id"] == provider_id:
-                score = calculate_trust_score(m.get("trust_level", ""))
-                if score > trust_score:
-                    trust_score = score
-
-        # Create match suggestion
-        match_in_db = RideMatchInDB(
-            requester_id=user_id,
-            provider_id=provider_id,
-            schedule_entry_id=schedule_id,
-            provider_schedule_id=str(match_schedule["_id"]),
-            match_score=trust_score,
-            status="suggested"
-        )
-        
-        result = await db.matches.insert_one(match_in_db.model_dump(by_alias=True, exclude={"id"}))
-        match_id = str(result.inserted_id)
-
-        # Create Notifications
-        
-        # 1. Notify Requester (Current User)
-        provider_user = await db.users.find_one({"_id": ObjectId(provider_id)})
-        provider_name = provider_user["name"] if provider_user else "a tribe member"
-        
-        req_notification = NotificationInDB(
-            user_id=user_id,
+    # A pair matched meanwhile by a concurrent pass fails the pair_key index; skip it
+    documents = [m.model_dump(by_alias=True, exclude={"id"}) for m in new_matches]
+    try:
+        await db.matches.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+        rejected = {err["index"] for err in e.details["writeErrors"]}
+        kept = [i for i in range(len(documents)) if i not in rejected]
+        new_matches = [new_matches[i] for i in kept]
+        documents = [documents[i] for i in kept]
+        if not new_matches:
+            return
+    inserted_ids = [doc["_id"] for doc in documents]
+
+    # 5. Notify both parties, with names resolved in one query
+    provider_ids = {m.provider_id for m in new_matches} - set(user_names)
+    if provider_ids:
+        providers = await db.users.find({"_id": {"$in": to_object_ids(provider_ids)}}).to_list(None)
+        user_names.update({str(u["_id"]): u["name"] for u in providers})
+
+    notifications = []
+    for match, match_oid in zip(new_matches, inserted_ids):
+        match_id = str(match_oid)
+        provider_name = user_names.get(match.provider_id, "a tribe member")
+        requester_name = user_names[match.requester_id]
+
+        # 1. Notify Requester
+        notifications.append(NotificationInDB(
+            user_id=match.requester_id,
             type="match_found",
             message=f"Ride match found with {provider_name}!",
             related_id=match_id
-        )
-        await db.notifications.insert_one(req_notification.model_dump(by_alias=True, exclude={"id"}))
-
+        ))
         # 2. Notify Provider (The other parent)
-        requester_name = requester_user["name"]
-        
-        prov_notification = NotificationInDB(
-            user_id=provider_id,
+        notifications.append(NotificationInDB(
+            user_id=match.provider_id,
             type="match_found",
             message=f"Ride match found with {requester_name}!",
             related_id=match_id
+        ))
+
+    await create_notifications(notifications)
+
+class _Horizon:
+    """Time bounds for one matching pass."""
+
+    def __init__(self, window: timedelta):
+        self.window = window
+        self.start = datetime.now(timezone.utc)
+        self.end = self.start + timedelta(days=settings.RECURRENCE_HORIZON_DAYS)
+
+    def probe_range(self, schedule: dict) -> Tuple[datetime, datetime]:
+        """
+        Range a partner schedule must fall in to possibly overlap `schedule`: one-off
+        partners picked up within it, or recurring partners starting before its end.
+        """
+        pickup_time = as_utc(schedule["pickup_time"])
+        if is_recurring(schedule.get("recurrence")):
+            return max(pickup_time, self.start) - self.window, self.end + self.window
+        return pickup_time - self.window, pickup_time + self.window
+
+    def overlaps(self, schedule: dict, candidate: dict) -> bool:
+        return first_overlap(
+            schedule["pickup_time"], schedule.get("recurrence"),
+            candidate["pickup_time"], candidate.get("recurrence"),
+            self.window, self.start, self.end
+        ) is not None
+
+async def _find_candidates_mongo(
+    new_schedules: List[dict],
+    keys_by_schedule: Dict[str, Dict[str, float]],
+    partner_scores: Dict[str, Dict[str, int]],
+    horizon: _Horizon
+) -> Dict[str, List[dict]]:
+    """
+    Candidate schedules per new schedule id as (schedule, distance in meters),
+    nearest first, fetched with a single $or query on schedules.place_key.
+    """
+    clauses = []
+    for s in new_schedules:
+        earliest, latest = horizon.probe_range(s)
+        keys = list(keys_by_schedule[str(s["_id"])])
+        clauses.append({
+            "user_id": {"$in": list(partner_scores[s["user_id"]])},
+            "place_key": keys[0] if len(keys) == 1 else {"$in": keys},
+            "$or": [
+                {"pickup_time": {"$gte": earliest, "$lte": latest}},
+                {"recurrence": {"$in": list(RECURRENCE_STEPS)}, "pickup_time": {"$lte": latest}}
+            ]
+        })
+
+    candidates = await db.schedules.find({"$or": clauses, "status": "active"}).to_list(None)
+    candidates_by_user = defaultdict(list)
+    for c in candidates:
+        candidates_by_user[c["user_id"]].append(c)
+
+    candidates_by_schedule = {}
+    for s in new_schedules:
+        keys = keys_by_schedule[str(s["_id"])]
+        found = [
+            (c, keys[c.get("place_key")])
+            for p in partner_scores[s["user_id"]] for c in candidates_by_user.get(p, ())
+            if c.get("place_key") in keys and horizon.overlaps(s, c)
+        ]
+        candidates_by_schedule[str(s["_id"])] = sorted(found, key=lambda item: item[1])
+    return candidates_by_schedule
+
+def _find_candidates_indexed(
+    new_schedules: List[dict],
+    keys_by_schedule: Dict[str, Dict[str, float]],
+    partner_scores: Dict[str, Dict[str, int]],
+    horizon: _Horizon
+) -> Dict[str, List[dict]]:
+    """
+    Candidate schedules per new schedule id as (schedule, distance in meters),
+    nearest first, probed from the in-memory schedule index.
+    """
+    candidates_by_schedule = {}
+    for s in new_schedules:
+        earliest, latest = horizon.probe_range(s)
+        partners = set(partner_scores[s["user_id"]])
+        found = {}
+        for key, distance in keys_by_schedule[str(s["_id"])].items():
+            for entry in schedule_index.candidates(key, partners, earliest, latest):
+                if entry.schedule_id not in found or distance < found[entry.schedule_id][1]:
+                    found[entry.schedule_id] = (entry.as_doc(), distance)
+        candidates_by_schedule[str(s["_id"])] = sorted(
+            (item for item in found.values() if horizon.overlaps(s, item[0])),
+            key=lambda item: item[1]
         )
-        await db.notifications.insert_one(prov_notification.model_dump(by_alias=True, exclude={"id"}))
+    return candidates_by_schedule
+
+async def _nearby_by_destination(destinations: List[dict]) -> Dict[str, List[Tuple[dict, float]]]:
+    """Destinations within MATCH_PROXIMITY_RADIUS_METERS of each given destination (empty when disabled)."""
+    radius = settings.MATCH_PROXIMITY_RADIUS_METERS
+    with_geo = [d for d in destinations if d.get("geo")]
+    if radius <= 0 or not with_geo:
+        return {}
+    results = await asyncio.gather(*(find_nearby_destinations(d["geo"], radius) for d in with_geo))
+    return {str(d["_id"]): r for d, r in zip(with_geo, results)}
+
+async def _target_place_keys(new_schedules: List[dict]) -> Dict[str, Dict[str, float]]:
+    """
+    Map each new schedule id to {place key: distance in meters}: its own place at
+    distance 0, plus, when proximity matching is enabled, the place of every
+    destination within MATCH_PROXIMITY_RADIUS_METERS. Destinations are only read
+    for proximity or for schedules written before place keys existed; schedules
+    whose destination is gone are omitted.
+    """
+    proximity_enabled = settings.MATCH_PROXIMITY_RADIUS_METERS > 0
+    dest_ids = {
+        s["destination_id"] for s in new_schedules
+        if proximity_enabled or not s.get("place_key")
+    }
+    destinations = []
+    if dest_ids:
+        destinations = await db.destinations.find({"_id": {"$in": to_object_ids(dest_ids)}}).to_list(None)
+    destinations_by_id = {str(d["_id"]): d for d in destinations}
+    nearby = await _nearby_by_destination(destinations)
+
+    keys_by_schedule = {}
+    for s in new_schedules:
+        own_key = s.get("place_key") or destination_place_key(destinations_by_id.get(s["destination_id"]))
+        if not own_key:
+            continue
+        keys = {}
+        for other, distance in nearby.get(s["destination_id"], ()):
+            key = destination_place_key(other)
+            keys[key] = min(keys.get(key, distance), distance)
+        keys[own_key] = 0.0
+        keys_by_schedule[str(s["_id"])] = keys
+    return keys_by_schedule
 
 async def invalidate_schedule_matches(schedule_id: str, reason: str = "schedule changed"):
     """
     Finds and removes matches for a schedule that is being modified or deleted.
     If a match was 'accepted', it notifies the other party.
     """
-    
-    # Find all matches involving this schedule
+    await invalidate_schedule_matches_bulk([schedule_id], reason)
+
+async def invalidate_schedule_matches_bulk(schedule_ids: List[str], reason: str = "schedule changed"):
+    """
+    Removes every match involving any of the given schedules, notifying the other
+    party of each accepted match. One find, one user lookup, one insert_many of
+    notifications and one delete_many, however many schedules and matches.
+    """
+    ids = list(dict.fromkeys(str(sid) for sid in schedule_ids))
+    if not ids:
+        return
+
     # We check both schedule_entry_id (if this was the trigger) and provider_schedule_id (if this was found as match)
     matches_to_invalidate = await db.matches.find({
         "$or": [
-            {"schedule_entry_id": schedule_id},
-            {"provider_schedule_id": schedule_id}
+            {"schedule_entry_id": {"$in": ids}},
+            {"provider_schedule_id": {"$in": ids}}
         ]
-    }).to_list(1000)
-    
+    }).to_list(None)
+    if not matches_to_invalidate:
+        return
+
+    # For accepted matches, the owner of the changed schedule is the "changing" user
+    # and the other party is notified. If both schedules changed, both are notified.
+    changed = set(ids)
+    cancellations = [] # (match, affected user, changing user)
     for match in matches_to_invalidate:
-        # If match was accepted, we need to notify the partners
-        if match.get("status") == "accepted":
-            
-            # Determine who is who
-            requester_id = match["requester_id"]
-            provider_id = match["provider_id"]
-            
-            # If the schedule being modified belongs to requester, notify provider, and vice-versa.
-            # We can check which schedule ID matches.
-            
-            affected_user_id = None
-            if match["schedule_entry_id"] == schedule_id:
-                # The "requester" owns the changed schedule, notify provider
-                affected_user_id = provider_id
-                changing_user_id = requester_id
-            else:
-                # The "provider" owns the changed schedule, notify requester
-                affected_user_id = requester_id
-                changing_user_id = provider_id
-                
-            # Fetch names for better notification
-            changing_user = await db.users.find_one({"_id": ObjectId(changing_user_id)})
-            changing_user_name = changing_user["name"] if changing_user else "Partner"
-            
-            # Create notification
-            notification = NotificationInDB(
+        if match.get("status") != "accepted":
+            continue
+        if match["schedule_entry_id"] in changed:
+            cancellations.append((match, match["provider_id"], match["requester_id"]))
+        if match.get("provider_schedule_id") in changed:
+            cancellations.append((match, match["requester_id"], match["provider_id"]))
+
+    if cancellations:
+        # Fetch names for better notification (one $in query)
+        changing_ids = {changing for _, _, changing in cancellations}
+        users = await db.users.find({"_id": {"$in": to_object_ids(changing_ids)}}, {"name": 1}).to_list(None)
+        names = {str(u["_id"]): u["name"] for u in users}
+        await create_notifications([
+            NotificationInDB(
                 user_id=affected_user_id,
                 type="match_cancelled",
-                message=f"Ride match with {changing_user_name} was cancelled because their schedule changed.",
+                message=f"Ride match with {names.get(changing_user_id, 'Partner')} was cancelled because their schedule changed.",
                 related_id=str(match["_id"])
             )
-            await db.notifications.insert_one(notification.model_dump(by_alias=True, exclude={"id"}))
+            for match, affected_user_id, changing_user_id in cancellations
+        ])
 
-        # Delete the match
-        await db.matches.delete_one({"_id": match["_id"]})
\ No newline at end of file
+    await db.matches.delete_many({"_id": {"$in": [m["_id"] for m in matches_to_invalidate]}})
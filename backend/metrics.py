@@ -0,0 +1,218 @@
+import bisect
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Optional, Sequence, Tuple
+from pymongo import monitoring
+
+# In-process metrics rendered in the Prometheus text exposition format by GET /metrics.
+# Values are per process: scrape every API and worker process separately.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names: Sequence[str], values: Sequence[str], le: Optional[str] = None) -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = defaultdict(float)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self):
+        yield from super().render()
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[i] += 1
+            state[-1] += value
+
+    def render(self):
+        yield from super().render()
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, _format_value(bound))} {cumulative}"
+            cumulative += state[len(self.buckets)]
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, '+Inf')} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-1])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}"
+
+REGISTRY = []
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# HTTP
+http_requests_total = Counter("http_requests_total", "Requests handled", ("method", "route", "status"))
+http_request_duration_seconds = Histogram("http_request_duration_seconds", "Request latency", ("method", "route"))
+http_requests_in_flight = Gauge("http_requests_in_flight", "Requests being handled", ("method",))
+
+# Mongo, attributed to the HTTP route or job type that issued the command
+mongo_commands_total = Counter("mongo_commands_total", "Mongo commands issued", ("source", "command"))
+mongo_command_duration_seconds = Histogram("mongo_command_duration_seconds", "Mongo command latency", ("source", "command"))
+mongo_commands_per_unit = Histogram(
+    "mongo_commands_per_unit", "Mongo commands issued per request or job batch", ("source",), buckets=COUNT_BUCKETS
+)
+mongo_command_failures_total = Counter("mongo_command_failures_total", "Mongo commands that failed", ("source", "command"))
+
+# Background jobs
+job_batches_total = Counter("job_batches_total", "Job batches run", ("type", "outcome"))
+job_batch_duration_seconds = Histogram("job_batch_duration_seconds", "Job batch run time", ("type", "outcome"))
+jobs_queued = Gauge("jobs_queued", "Jobs in the queue, sampled at scrape time", ("type", "status"))
+
+class UnitStats:
+    """Mongo commands issued while handling one request or job batch."""
+
+    def __init__(self):
+        self.source: Optional[str] = None
+        self.commands = 0
+        self._lock = threading.Lock()
+        self._pending = [] # (command, seconds, failed) until the source is known
+
+    def record(self, command: str, seconds: float, failed: bool):
+        with self._lock:
+            self.commands += 1
+            if self.source is None:
+                self._pending.append((command, seconds, failed))
+                return
+        _observe_command(self.source, command, seconds, failed)
+
+    def finish(self, source: str):
+        """Attribute buffered commands to `source` (e.g. the matched route template)."""
+        with self._lock:
+            self.source = source
+            pending, self._pending = self._pending, []
+            commands = self.commands
+        for command, seconds, failed in pending:
+            _observe_command(source, command, seconds, failed)
+        mongo_commands_per_unit.observe(commands, source=source)
+
+def _observe_command(source: str, command: str, seconds: float, failed: bool):
+    mongo_commands_total.inc(source=source, command=command)
+    mongo_command_duration_seconds.observe(seconds, source=source, command=command)
+    if failed:
+        mongo_command_failures_total.inc(source=source, command=command)
+
+_current_unit: contextvars.ContextVar[Optional[UnitStats]] = contextvars.ContextVar("metrics_unit", default=None)
+
+@contextmanager
+def track_unit():
+    """Collect Mongo commands issued inside the block (Motor carries the context into its threads)."""
+    stats = UnitStats()
+    token = _current_unit.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_unit.reset(token)
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo listener feeding the Mongo metrics; commands outside a request or job count as "other"."""
+
+    def started(self, event):
+        pass
+
+    def _record(self, event, failed: bool):
+        seconds = event.duration_micros / 1_000_000
+        stats = _current_unit.get()
+        if stats is None:
+            _observe_command("other", event.command_name, seconds, failed)
+        else:
+            stats.record(event.command_name, seconds, failed)
+
+    def succeeded(self, event):
+        self._record(event, failed=False)
+
+    def failed(self, event):
+        self._record(event, failed=True)
+
+@contextmanager
+def time_job_batch(job_type: str):
+    """Time a job batch and attribute its Mongo commands to "job:<type>"."""
+    start = time.perf_counter()
+    outcome = "ok"
+    with track_unit() as stats:
+        try:
+            yield
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            job_batches_total.inc(type=job_type, outcome=outcome)
+            job_batch_duration_seconds.observe(elapsed, type=job_type, outcome=outcome)
+            stats.finish(f"job:{job_type}")
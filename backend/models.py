@@ -1,4 +1,4 @@
-from typing import Optional, Annotated
+from typing import List, Optional, Annotated
 from pydantic import BaseModel, Field, BeforeValidator, ConfigDict, field_validator
 from datetime import datetime, timezone
 from utils import normalize_phone
@@ -189,6 +189,8 @@ class DestinationUpdate(BaseModel):
 class DestinationInDB(DestinationBase):
     id: Optional[PyObjectId] = Field(alias="_id", default=None)
     created_by: PyObjectId
+    location: Optional[dict] = None # GeoJSON point derived from geo, for the 2dsphere index
+    place_key: Optional[str] = None # Canonical place (places._id) this destination is linked to
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
     model_config = ConfigDict(
@@ -205,6 +207,18 @@ class DestinationResponse(DestinationBase):
         populate_by_name=True,
         arbitrary_types_allowed=True,
     )
+class DestinationImportResult(BaseModel):
+    row: int # 1-based position in the upload
+    status: str # "created", "duplicate" or "invalid"
+    destination_id: Optional[str] = None # New or already existing destination
+    detail: Optional[str] = None
+
+class DestinationImportResponse(BaseModel):
+    created: int
+    duplicates: int
+    invalid: int
+    results: List[DestinationImportResult]
+
 class ScheduleEntryBase(BaseModel):
     child_name: str
     destination_id: PyObjectId
@@ -236,6 +250,7 @@ class ScheduleEntryCreate(ScheduleEntryBase):
 class ScheduleEntryInDB(ScheduleEntryBase):
     id: Optional[PyObjectId] = Field(alias="_id", default=None)
     user_id: PyObjectId
+    place_key: Optional[str] = None # Copied from the destination; matching filters on it
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
     model_config = ConfigDict(
@@ -260,10 +275,12 @@ class RideMatchBase(BaseModel):
     schedule_entry_id: PyObjectId # The schedule that triggered the match
     provider_schedule_id: Optional[PyObjectId] = None # The existing schedule found
     match_score: int
+    distance_meters: Optional[float] = None # Set when matched by proximity rather than same place
     status: str = "suggested" # suggested, accepted, declined
 
 class RideMatchInDB(RideMatchBase):
     id: Optional[PyObjectId] = Field(alias="_id", default=None)
+    pair_key: Optional[str] = None # Both schedule ids, sorted; unique so a pair is matched once
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
     model_config = ConfigDict(
@@ -287,6 +304,13 @@ class NotificationInDB(NotificationBase):
         arbitrary_types_allowed=True,
     )
 
+class NotificationMarkRead(BaseModel):
+    all: bool = False
+    ids: List[str] = []
+
+class UnreadCountResponse(BaseModel):
+    unread: int
+
 class NotificationResponse(NotificationBase):
     id: Optional[PyObjectId] = Field(alias="_id", default=None)
     created_at: datetime
@@ -0,0 +1,77 @@
+import base64
+import json
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException, Response
+
+# Response header carrying the opaque cursor for the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# Response header carrying the cursor of the newest item seen, for `since` polling
+LATEST_CURSOR_HEADER = "X-Latest-Cursor"
+
+def encode_cursor(sort_value: Optional[datetime], doc_id) -> str:
+    payload = {"v": sort_value.isoformat() if sort_value else None, "id": str(doc_id)}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], ObjectId]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value = datetime.fromisoformat(payload["v"]) if payload["v"] else None
+        return value, ObjectId(payload["id"])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_filter(cursor: str, sort_field: str = "created_at", newer: bool = False) -> dict:
+    """
+    Filter selecting documents after `cursor` in (sort_field desc, _id desc) order,
+    or before it (i.e. newer) when `newer` is set.
+    """
+    value, oid = decode_cursor(cursor)
+    op = "$gt" if newer else "$lt"
+    return {"$or": [
+        {sort_field: {op: value}},
+        {sort_field: value, "_id": {op: oid}}
+    ]}
+
+async def paginate(
+    collection,
+    query: dict,
+    limit: int,
+    cursor: Optional[str] = None,
+    sort_field: str = "created_at",
+    since: Optional[str] = None,
+    since_overlap: Optional[timedelta] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Keyset pagination, newest first. Returns one page of documents and the cursor
+    for the next page, or None when there are no more. With `since`, only documents
+    newer than that cursor are considered; with `since_overlap` as well, documents up
+    to that much older than it are returned again, for writes that become visible out
+    of order (callers dedupe by _id).
+    """
+    clauses = [query]
+    if cursor:
+        clauses.append(keyset_filter(cursor, sort_field))
+    if since:
+        since_value, _ = decode_cursor(since)
+        if since_overlap and since_value is not None:
+            clauses.append({sort_field: {"$gte": since_value - since_overlap}})
+        else:
+            clauses.append(keyset_filter(since, sort_field, newer=True))
+    if len(clauses) > 1:
+        query = {"$and": clauses}
+
+    docs = await collection.find(query).sort([(sort_field, -1), ("_id", -1)]).to_list(limit + 1)
+    if len(docs) <= limit:
+        return docs, None
+
+    docs = docs[:limit]
+    last = docs[-1]
+    return docs, encode_cursor(last.get(sort_field), last["_id"])
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import sys
+from collections import defaultdict
+from typing import Dict, Iterable
+
+# Allow running as a script: python peers.py (rebuilds the whole graph)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pymongo import UpdateOne
+from db import db
+
+# Materialized tribe-peer graph, one document per user:
+#   tribe_peers: {_id: user_id, peers: {peer_user_id: trust score}}
+# A peer is anyone sharing a tribe with the user (declined memberships excluded); the
+# score is the best trust level the peer holds in any shared tribe. A membership write
+# only changes edges between members of that tribe, so routers call
+# refresh_tribe_peers() afterwards and matching reads a user's peers by _id.
+
+def calculate_trust_score(trust_level: str) -> int:
+    if trust_level == "direct":
+        return 100
+    elif trust_level == "activity-specific":
+        return 80
+    elif trust_level == "emergency-only":
+        return 60
+    return 50
+
+_ACTIVE_MEMBERSHIP = {"status": {"$ne": "declined"}}
+
+async def _compute_peers(user_ids) -> Dict[str, Dict[str, int]]:
+    """{user: {peer: score}} for the given users, from tribe_memberships (two $in reads)."""
+    user_ids = list(user_ids)
+    memberships = await db.tribe_memberships.find({"user_id": {"$in": user_ids}, **_ACTIVE_MEMBERSHIP}).to_list(None)
+    tribe_ids = list({m["tribe_id"] for m in memberships})
+    co_memberships = []
+    if tribe_ids:
+        co_memberships = await db.tribe_memberships.find({"tribe_id": {"$in": tribe_ids}, **_ACTIVE_MEMBERSHIP}).to_list(None)
+    members_by_tribe = defaultdict(list)
+    for m in co_memberships:
+        members_by_tribe[m["tribe_id"]].append(m)
+
+    peers = {uid: {} for uid in user_ids}
+    for own in memberships:
+        user_id = own["user_id"]
+        scores = peers[user_id]
+        for m in members_by_tribe[own["tribe_id"]]:
+            if m["user_id"] != user_id:
+                score = calculate_trust_score(m.get("trust_level", ""))
+                scores[m["user_id"]] = max(scores.get(m["user_id"], 0), score)
+    return peers
+
+async def refresh_peers(user_ids: Iterable[str]):
+    """Recompute and store the peer documents of the given users."""
+    user_ids = list(dict.fromkeys(str(uid) for uid in user_ids))
+    if not user_ids:
+        return
+    peers = await _compute_peers(user_ids)
+    await db.tribe_peers.bulk_write([
+        UpdateOne({"_id": uid}, {"$set": {"peers": peers[uid]}}, upsert=True)
+        for uid in user_ids
+    ], ordered=False)
+
+async def refresh_tribe_peers(tribe_ids: Iterable[str], extra_user_ids: Iterable[str] = ()):
+    """
+    Update the graph after membership changes in `tribe_ids`: every current member,
+    plus `extra_user_ids` (e.g. a member just removed), is recomputed.
+    """
+    tribe_ids = [str(tid) for tid in tribe_ids]
+    members = await db.tribe_memberships.find({"tribe_id": {"$in": tribe_ids}}, {"user_id": 1}).to_list(None)
+    await refresh_peers([m["user_id"] for m in members] + [str(uid) for uid in extra_user_ids])
+
+async def remove_user_peers(user_id: str):
+    """Drop a deleted user from the graph."""
+    doc = await db.tribe_peers.find_one({"_id": user_id})
+    if not doc:
+        return
+    operations = [UpdateOne({"_id": peer_id}, {"$unset": {f"peers.{user_id}": ""}}) for peer_id in doc.get("peers", {})]
+    if operations:
+        await db.tribe_peers.bulk_write(operations, ordered=False)
+    await db.tribe_peers.delete_one({"_id": user_id})
+
+async def load_peer_scores(user_ids: Iterable[str]) -> Dict[str, Dict[str, int]]:
+    """
+    {user: {peer: trust score}} in one indexed read. Users not yet in the graph
+    (written before it existed) are computed from memberships and stored.
+    """
+    user_ids = list(dict.fromkeys(str(uid) for uid in user_ids))
+    docs = await db.tribe_peers.find({"_id": {"$in": user_ids}}).to_list(None)
+    scores = {doc["_id"]: doc.get("peers", {}) for doc in docs}
+    missing = [uid for uid in user_ids if uid not in scores]
+    if missing:
+        await refresh_peers(missing)
+        docs = await db.tribe_peers.find({"_id": {"$in": missing}}).to_list(None)
+        scores.update({doc["_id"]: doc.get("peers", {}) for doc in docs})
+    return scores
+
+async def rebuild_peers(batch_size: int = 500):
+    """Rebuild the whole graph from tribe_memberships."""
+    user_ids = await db.tribe_memberships.distinct("user_id")
+    await db.tribe_peers.delete_many({})
+    for start in range(0, len(user_ids), batch_size):
+        chunk = user_ids[start:start + batch_size]
+        await refresh_peers(chunk)
+    print(f"Rebuilt tribe peers for {len(user_ids)} users.")
+
+if __name__ == "__main__":
+    # Fix for Windows asyncio loop policy
+    if os.name == 'nt':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    asyncio.run(rebuild_peers())
@@ -0,0 +1,84 @@
+from datetime import datetime, timezone
+from typing import List, Optional
+from pymongo import UpdateOne
+from db import db
+from utils import normalize_place_name, place_key
+
+# Canonical places. Every destination is linked to one at write time through its
+# `place_key`, and schedules copy the key of their destination, so matching is a
+# single indexed equality on schedules.place_key.
+#
+# places document: {_id: place key, google_place_id, normalized_name, name, created_at}
+
+async def resolve_place_key(destination: dict) -> str:
+    """
+    Link a destination (document or create/update data) to its canonical place,
+    registering the place if needed, and return the place key.
+
+    Verified destinations are keyed by Google place id. Unverified ones reuse a
+    place already registered under the same normalized name (preferring a verified
+    one), so a hand-typed "Lincoln Elementary" joins the verified school.
+    """
+    return (await resolve_place_keys([destination]))[0]
+
+async def resolve_place_keys(destinations: List[dict]) -> List[str]:
+    """
+    Batch form of resolve_place_key: one name lookup and one bulk upsert for all
+    destinations. Unverified entries also join verified places from the same batch.
+    """
+    now = datetime.now(timezone.utc)
+    names = [normalize_place_name(d.get("name")) for d in destinations]
+
+    # Verified places in this batch, by normalized name
+    verified_by_name = {}
+    for d, name in zip(destinations, names):
+        if d.get("google_place_id"):
+            verified_by_name.setdefault(name, place_key(d))
+
+    unverified_names = list({
+        name for d, name in zip(destinations, names)
+        if not d.get("google_place_id") and name not in verified_by_name
+    })
+    existing_by_name = {}
+    if unverified_names:
+        cursor = db.places.find({"normalized_name": {"$in": unverified_names}}).sort("google_place_id", -1)
+        async for place in cursor:
+            existing_by_name.setdefault(place["normalized_name"], place["_id"])
+
+    keys = []
+    new_places = {}
+    for d, name in zip(destinations, names):
+        if d.get("google_place_id"):
+            key = place_key(d)
+            new_places.setdefault(key, {
+                "google_place_id": d["google_place_id"],
+                "normalized_name": name,
+                "name": d.get("name"),
+                "created_at": now
+            })
+        elif name in verified_by_name:
+            key = verified_by_name[name]
+        elif name in existing_by_name:
+            key = existing_by_name[name]
+        else:
+            key = place_key(d)
+            new_places.setdefault(key, {
+                "google_place_id": None,
+                "normalized_name": name,
+                "name": d.get("name"),
+                "created_at": now
+            })
+        keys.append(key)
+
+    if new_places:
+        await db.places.bulk_write([
+            UpdateOne({"_id": key}, {"$setOnInsert": place}, upsert=True)
+            for key, place in new_places.items()
+        ], ordered=False)
+    return keys
+
+def destination_place_key(destination: Optional[dict]) -> Optional[str]:
+    """Place key of a stored destination; computed for rows not yet backfilled."""
+    if not destination:
+        return None
+    return destination.get("place_key") or place_key(destination)
@@ -0,0 +1,170 @@
+import contextvars
+import os
+import sys
+import sysconfig
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, NamedTuple, Optional
+
+# Opt-in query profiler (QUERY_PROFILER_ENABLED). db.py wraps the Motor database so
+# every collection operation is recorded, with the line of application code that
+# issued it, in the profile of the current request (or of a profile_queries() block).
+# Repeats of one query shape from one call site are reported as N+1 patterns, and a
+# profile can be checked against a query budget so tests fail on round-trip explosions.
+#
+#   with assert_query_budget(5):
+#       await client.get("/api/v1/tribes/", headers=headers)
+
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+_SKIP_FILES = {os.path.abspath(__file__), os.path.join(_BACKEND_DIR, "db.py")}
+# Frames in the standard library and installed packages (Motor, Starlette, ...) are not call sites
+_LIBRARY_DIRS = tuple({os.path.abspath(sysconfig.get_paths()[key]) for key in ("stdlib", "platstdlib", "purelib", "platlib")})
+
+# Collection methods that send a command to the server
+_OPERATIONS = {
+    "find", "find_one", "find_one_and_update", "find_one_and_replace", "find_one_and_delete",
+    "insert_one", "insert_many", "update_one", "update_many", "replace_one",
+    "delete_one", "delete_many", "bulk_write", "aggregate", "distinct",
+    "count_documents", "estimated_document_count", "create_index", "create_indexes"
+}
+
+class QueryRecord(NamedTuple):
+    collection: str
+    operation: str
+    shape: str # Filter (or pipeline) with values replaced by "?"
+    call_site: str # "routers/auth.py:55 in signup"
+
+class NPlusOne(NamedTuple):
+    collection: str
+    operation: str
+    shape: str
+    call_site: str
+    count: int
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+def query_shape(value) -> str:
+    """Structure of a filter or pipeline without its values, e.g. {'_id': {'$in': ?}}."""
+    def strip(v):
+        if isinstance(v, dict):
+            return {k: strip(item) for k, item in v.items()}
+        if isinstance(v, list) and v and all(isinstance(item, dict) for item in v):
+            return [strip(item) for item in v] # Pipelines and $or/$and clauses
+        return "?"
+    return repr(strip(value)) if value is not None else ""
+
+def _call_site() -> str:
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename not in _SKIP_FILES and not filename.startswith(_LIBRARY_DIRS) and not filename.startswith("<"):
+            if filename.startswith(_BACKEND_DIR):
+                filename = os.path.relpath(filename, _BACKEND_DIR)
+            return f"{filename}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+class QueryProfile:
+    """Queries recorded for one request or profile_queries() block."""
+
+    def __init__(self, parent: Optional["QueryProfile"] = None):
+        self.queries: List[QueryRecord] = []
+        self._parent = parent # Enclosing profile, e.g. a test's around a request's
+
+    def __len__(self):
+        return len(self.queries)
+
+    def record(self, query: QueryRecord):
+        self.queries.append(query)
+        if self._parent is not None:
+            self._parent.record(query)
+
+    def n_plus_one(self, threshold: int) -> List[NPlusOne]:
+        """Query shapes issued at least `threshold` times from the same call site."""
+        counts: Dict[QueryRecord, int] = defaultdict(int)
+        for query in self.queries:
+            counts[query] += 1
+        return sorted(
+            (NPlusOne(*query, count) for query, count in counts.items() if count >= threshold),
+            key=lambda n: -n.count
+        )
+
+    def report(self) -> str:
+        counts: Dict[QueryRecord, int] = defaultdict(int)
+        for query in self.queries:
+            counts[query] += 1
+        lines = [f"{len(self.queries)} queries"]
+        for query, count in sorted(counts.items(), key=lambda item: -item[1]):
+            lines.append(f"  {count:>4}x {query.collection}.{query.operation} {query.shape}  [{query.call_site}]")
+        return "\n".join(lines)
+
+_current_profile: contextvars.ContextVar[Optional[QueryProfile]] = contextvars.ContextVar("query_profile", default=None)
+
+@contextmanager
+def profile_queries():
+    """Record the queries issued inside the block (and tasks it starts); nests."""
+    profile = QueryProfile(_current_profile.get())
+    token = _current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _current_profile.reset(token)
+
+@contextmanager
+def assert_query_budget(max_queries: int, n_plus_one_threshold: Optional[int] = None):
+    """
+    Fail (QueryBudgetExceeded, an AssertionError) if the block issues more than
+    `max_queries` queries, or any N+1 pattern of at least `n_plus_one_threshold` repeats.
+    """
+    with profile_queries() as profile:
+        yield profile
+    if len(profile) > max_queries:
+        raise QueryBudgetExceeded(f"Query budget of {max_queries} exceeded\n{profile.report()}")
+    if n_plus_one_threshold and profile.n_plus_one(n_plus_one_threshold):
+        raise QueryBudgetExceeded(f"N+1 query pattern detected\n{profile.report()}")
+
+class ProfiledCollection:
+    """Records operations on a Motor collection, then delegates to it."""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in _OPERATIONS:
+            return attr
+
+        def operation(*args, **kwargs):
+            profile = _current_profile.get()
+            if profile is not None:
+                spec = args[0] if args else kwargs.get("filter", kwargs.get("pipeline"))
+                if name in ("insert_one", "insert_many", "bulk_write", "create_index", "create_indexes"):
+                    spec = None
+                elif name == "distinct":
+                    spec = args[1] if len(args) > 1 else kwargs.get("filter")
+                profile.record(QueryRecord(self._collection.name, name, query_shape(spec), _call_site()))
+            return attr(*args, **kwargs)
+        return operation
+
+class ProfiledDatabase:
+    """Drop-in wrapper for the Motor database handing out ProfiledCollections."""
+
+    def __init__(self, database):
+        self._database = database
+        self._collections: Dict[str, ProfiledCollection] = {}
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            return getattr(self._database, name)
+        return self[name]
+
+    def __getitem__(self, name) -> ProfiledCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = ProfiledCollection(self._database[name])
+        return collection
+
+    # Database-level method used by the app
+    def list_collection_names(self, *args, **kwargs):
+        return self._database.list_collection_names(*args, **kwargs)
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+from typing import Iterator, Optional
+from utils import as_utc
+
+# Interval between occurrences per recurrence value; "once" (and anything unknown)
+# has a single occurrence. Occurrences are computed in UTC, so a weekly 8:00 run
+# shifts by an hour locally across DST changes.
+RECURRENCE_STEPS = {
+    "daily": timedelta(days=1),
+    "weekly": timedelta(weeks=1),
+}
+
+def is_recurring(recurrence: Optional[str]) -> bool:
+    return recurrence in RECURRENCE_STEPS
+
+def next_occurrence(start: datetime, recurrence: Optional[str], at_or_after: datetime) -> Optional[datetime]:
+    """
+    First occurrence of a schedule starting at `start` that is >= `at_or_after`,
+    computed arithmetically (no iteration over earlier occurrences).
+    """
+    start = as_utc(start)
+    at_or_after = as_utc(at_or_after)
+    step = RECURRENCE_STEPS.get(recurrence)
+    if step is None:
+        return start if start >= at_or_after else None
+    if start >= at_or_after:
+        return start
+    periods = -((start - at_or_after) // step)  # ceil((at_or_after - start) / step)
+    return start + periods * step
+
+def iter_occurrences(
+    start: datetime,
+    recurrence: Optional[str],
+    horizon_start: datetime,
+    horizon_end: datetime
+) -> Iterator[datetime]:
+    """Lazily yield occurrences within [horizon_start, horizon_end]."""
+    step = RECURRENCE_STEPS.get(recurrence)
+    current = next_occurrence(start, recurrence, horizon_start)
+    horizon_end = as_utc(horizon_end)
+    while current is not None and current <= horizon_end:
+        yield current
+        if step is None:
+            return
+        current += step
+
+def first_overlap(
+    a_start: datetime,
+    a_recurrence: Optional[str],
+    b_start: datetime,
+    b_recurrence: Optional[str],
+    window: timedelta,
+    horizon_start: datetime,
+    horizon_end: datetime
+) -> Optional[datetime]:
+    """
+    Earliest occurrence of schedule A within `window` of an occurrence of schedule B,
+    looking at [horizon_start, horizon_end]. Returns None if there is none.
+
+    Sweeps both occurrence sequences in time order, always advancing the one that
+    is behind straight to the first occurrence that could still overlap, so the
+    cost is bounded by the number of occurrences in the horizon, never their product.
+    Two one-off schedules are compared directly, regardless of the horizon.
+    """
+    if not is_recurring(a_recurrence) and not is_recurring(b_recurrence):
+        a, b = as_utc(a_start), as_utc(b_start)
+        return a if abs(a - b) <= window else None
+
+    horizon_end = as_utc(horizon_end)
+    a = next_occurrence(a_start, a_recurrence, horizon_start)
+    b = next_occurrence(b_start, b_recurrence, as_utc(horizon_start) - window)
+    while a is not None and b is not None and a <= horizon_end:
+        if abs(a - b) <= window:
+            return a
+        if a < b:
+            a = next_occurrence(a_start, a_recurrence, b - window)
+        else:
+            b = next_occurrence(b_start, b_recurrence, a - window)
+    return None
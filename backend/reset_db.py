@@ -16,7 +16,11 @@ async def reset_db():
         "destinations", 
         "matches", 
         "notifications", 
-        "pending_invites"
+        "notification_counters",
+        "pending_invites",
+        "tribe_peers",
+        "places",
+        "jobs"
     ]
     
     print("Starting database reset...")
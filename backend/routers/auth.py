@@ -1,3 +1,4 @@
+import logging
 from datetime import timedelta
 from bson import ObjectId
 from fastapi import APIRouter, Depends, HTTPException, status
@@ -7,7 +8,14 @@ from models import (
     UserCreate, UserResponse, UserInDB, UserLogin, Token, AuthResponse,
     TribeMembershipInDB, NotificationInDB, UserUpdate
 )
-from auth import get_password_hash, verify_password, create_access_token, get_current_user
+from hydration import Hydrator
+from peers import refresh_tribe_peers, remove_user_peers
+from schedule_index import unindex_user
+from services.notifications import create_notifications
+from utils import to_object_ids
+from auth import get_password_hash_async, verify_password_async, create_access_token, get_current_user, user_cache
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -22,7 +30,7 @@ async def signup(user: UserCreate):
             )
         
         # Create new user
-        hashed_password = get_password_hash(user.password)
+        hashed_password = await get_password_hash_async(user.password)
         user_in_db = UserInDB(
             name=user.name,
             phone=user.phone,
@@ -34,41 +42,49 @@ async def signup(user: UserCreate):
         
         # Process Pending Invites
         pending_invites = await db.pending_invites.find({"phone": user.phone}).to_list(100)
-        
-        for invite in pending_invites:
-            # Create membership
-            membership = TribeMembershipInDB(
-                tribe_id=str(invite["tribe_id"]),
-                user_id=str(new_user.inserted_id),
-                trust_level=invite["trust_level"],
-                status="invited"
-            )
-            await db.tribe_memberships.insert_one(membership.model_dump(by_alias=True, exclude={"id"}))
-            
+        invite_notifications = []
+
+        if pending_invites:
+            # Create memberships
             # Note: Do NOT increment tribe member count here. Wait for acceptance.
-            
+            await db.tribe_memberships.insert_many([
+                TribeMembershipInDB(
+                    tribe_id=str(invite["tribe_id"]),
+                    user_id=str(new_user.inserted_id),
+                    trust_level=invite["trust_level"],
+                    status="invited"
+                ).model_dump(by_alias=True, exclude={"id"})
+                for invite in pending_invites
+            ])
+
+            # Load the tribes and inviters named in the notifications in one query each
+            tribes = await db.tribes.find(
+                {"_id": {"$in": to_object_ids(invite["tribe_id"] for invite in pending_invites)}},
+                {"name": 1}
+            ).to_list(None)
+            tribe_names = {str(t["_id"]): t["name"] for t in tribes}
+            hydrator = Hydrator()
+            await hydrator.load_users(invite.get("invited_by") for invite in pending_invites)
+
+        for invite in pending_invites:
             # Notify new user
-            tribe = await db.tribes.find_one({"_id": invite["tribe_id"]})
-            tribe_name = tribe["name"] if tribe else "Unknown Tribe"
-            
-            # Fetch inviter name
-            inviter_name = "someone"
-            if "invited_by" in invite:
-                inviter = await db.users.find_one({"_id": ObjectId(invite["invited_by"])})
-                if inviter:
-                    inviter_name = inviter["name"]
-
-            notification = NotificationInDB(
+            tribe_name = tribe_names.get(str(invite["tribe_id"]), "Unknown Tribe")
+            inviter = hydrator.user_doc(invite.get("invited_by"))
+            inviter_name = inviter["name"] if inviter else "someone"
+
+            invite_notifications.append(NotificationInDB(
                 user_id=str(new_user.inserted_id),
                 type="invite_received",
                 message=f"You have been invited by {inviter_name} to join the tribe '{tribe_name}'!",
                 related_id=str(invite["tribe_id"])
-            )
-            await db.notifications.insert_one(notification.model_dump(by_alias=True, exclude={"id"}))
+            ))
+
+        await create_notifications(invite_notifications)
 
         # Clean up pending invites
         if pending_invites:
             await db.pending_invites.delete_many({"phone": user.phone})
+            await refresh_tribe_peers(str(invite["tribe_id"]) for invite in pending_invites)
 
         # Create access token
         access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -84,7 +100,7 @@ async def signup(user: UserCreate):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"CRITICAL ERROR IN SIGNUP: {str(e)}") # Force log to stdout
+        logger.exception("Signup failed")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Signup failed: {str(e)}"
@@ -93,7 +109,7 @@ async def signup(user: UserCreate):
 @router.post("/login", response_model=AuthResponse)
 async def login(user_credentials: UserLogin):
     user = await db.users.find_one({"phone": user_credentials.phone})
-    if not user or not verify_password(user_credentials.password, user["hashed_password"]):
+    if not user or not await verify_password_async(user_credentials.password, user["hashed_password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect phone number or password",
@@ -141,6 +157,7 @@ async def update_user_me(
         {"_id": ObjectId(current_user.id)},
         {"$set": update_data}
     )
+    user_cache.invalidate(current_user.phone)
 
     updated_user = await db.users.find_one({"_id": ObjectId(current_user.id)})
     return updated_user
@@ -159,6 +176,7 @@ async def delete_me(current_user: UserInDB = Depends(get_current_user)):
     
     # Delete schedules created by user
     await db.schedules.delete_many({"user_id": user_id})
+    unindex_user(user_id)
     
     # Delete matches where user is requester or provider
     await db.matches.delete_many({
@@ -184,5 +202,7 @@ async def delete_me(current_user: UserInDB = Depends(get_current_user)):
 
     # 2. Delete the user
     await db.users.delete_one({"_id": ObjectId(user_id)})
+    await remove_user_peers(user_id)
+    user_cache.invalidate(current_user.phone)
     
     return None
\ No newline at end of file
@@ -1,27 +1,45 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Body, BackgroundTasks
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Body, Query, Response, UploadFile, File
+from typing import List, Optional
+import asyncio
+import csv
+import io
+from pydantic import ValidationError
 from datetime import datetime, timezone
 from db import db
 from bson import ObjectId
 from bson.errors import InvalidId
-from models import DestinationCreate, DestinationResponse, DestinationInDB, UserInDB, DestinationUpdate
+from config import settings
+from models import (
+    DestinationCreate, DestinationResponse, DestinationInDB, UserInDB, DestinationUpdate,
+    DestinationImportResult, DestinationImportResponse
+)
 from auth import get_current_user
-from matching import find_and_create_matches, invalidate_schedule_matches
+from geo import geo_point
+from pagination import paginate, set_next_cursor
+from places import resolve_place_key, resolve_place_keys
+from recurrence import RECURRENCE_STEPS
+from matching import enqueue_matching, invalidate_schedule_matches_bulk
+from schedule_index import schedule_index, refresh_schedules
 from services.google_maps import get_place_details
 
 router = APIRouter()
 
 @router.get("/", response_model=List[DestinationResponse])
 async def list_destinations(
+    response: Response,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
     current_user: UserInDB = Depends(get_current_user)
 ):
     """
-    List all destinations created by the current user.
+    List destinations created by the current user, newest first.
+    Pass the X-Next-Cursor response header back as `cursor` to get the next page.
     """
-    destinations = await db.destinations.find({
+    destinations, next_cursor = await paginate(db.destinations, {
         "created_by": current_user.id,
         "is_archived": {"$ne": True}
-    }).to_list(1000)
+    }, limit, cursor)
+    set_next_cursor(response, next_cursor)
     return destinations
 
 @router.post("/", response_model=DestinationResponse, status_code=status.HTTP_201_CREATED)
@@ -42,7 +60,9 @@ async def create_destination(
             # Override with verified data
             destination_data.update(verified_data)
             destination_data["verified_date"] = datetime.now(timezone.utc)
-            
+    destination_data["location"] = geo_point(destination_data.get("geo"))
+    destination_data["place_key"] = await resolve_place_key(destination_data)
+
     # Create DB model
     new_destination = DestinationInDB(**destination_data)
     
@@ -54,6 +74,119 @@ async def create_destination(
     
     return created_destination
 
+@router.post("/import", response_model=DestinationImportResponse)
+async def import_destinations(
+    rows: List[dict] = Body(...),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Create many destinations from a JSON array of DestinationCreate objects.
+    Rows are validated individually; see import_destinations_csv for the result format.
+    """
+    return await _import_destinations(rows, current_user)
+
+@router.post("/import/csv", response_model=DestinationImportResponse)
+async def import_destinations_csv(
+    file: UploadFile = File(...),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Create many destinations from a CSV upload with a header row. Columns:
+    name, address, google_place_id, lat, lng, category (only name and address required).
+    Each row is reported as created, duplicate (the user already has a destination at
+    that place, or it appears earlier in the upload) or invalid.
+    """
+    try:
+        text = (await file.read()).decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV file must be UTF-8 encoded")
+
+    rows = []
+    for record in csv.DictReader(io.StringIO(text)):
+        row = {k.strip(): v.strip() for k, v in record.items() if k and v and v.strip()}
+        lat, lng = row.pop("lat", None), row.pop("lng", None)
+        if lat is not None or lng is not None:
+            row["geo"] = {"lat": lat, "lng": lng}
+        rows.append(row)
+    return await _import_destinations(rows, current_user)
+
+async def _import_destinations(rows: List[dict], current_user: UserInDB) -> DestinationImportResponse:
+    if len(rows) > settings.DESTINATION_IMPORT_MAX_ROWS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.DESTINATION_IMPORT_MAX_ROWS} destinations can be imported at once"
+        )
+
+    results: List[Optional[DestinationImportResult]] = [None] * len(rows)
+    valid = [] # (index, destination data)
+    for i, row in enumerate(rows):
+        try:
+            destination = DestinationCreate(**row)
+        except ValidationError as e:
+            errors = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            results[i] = DestinationImportResult(row=i + 1, status="invalid", detail=errors)
+            continue
+        valid.append((i, destination.model_dump()))
+
+    # Verify each distinct place id once, a bounded number at a time
+    place_ids = list({data["google_place_id"] for _, data in valid if data.get("google_place_id")})
+    slots = asyncio.Semaphore(settings.DESTINATION_IMPORT_VERIFY_CONCURRENCY)
+
+    async def verify(place_id):
+        async with slots:
+            return await get_place_details(place_id)
+
+    verified = dict(zip(place_ids, await asyncio.gather(*(verify(p) for p in place_ids))))
+
+    now = datetime.now(timezone.utc)
+    for _, data in valid:
+        data["created_by"] = current_user.id
+        verified_data = verified.get(data.get("google_place_id"))
+        if verified_data:
+            data.update(verified_data)
+            data["verified_date"] = now
+        data["location"] = geo_point(data.get("geo"))
+
+    keys = await resolve_place_keys([data for _, data in valid])
+
+    # Deduplicate against the user's destinations and within the upload
+    existing = await db.destinations.find(
+        {"created_by": current_user.id, "is_archived": {"$ne": True}, "place_key": {"$in": list(set(keys))}},
+        {"_id": 1, "place_key": 1}
+    ).to_list(None)
+    seen = {d["place_key"]: str(d["_id"]) for d in existing}
+    first_row = {}
+    repeats = [] # (index, index of the earlier row at the same place)
+
+    to_insert = [] # (index, document)
+    for (i, data), key in zip(valid, keys):
+        if key in seen:
+            results[i] = DestinationImportResult(row=i + 1, status="duplicate", destination_id=seen[key])
+            continue
+        if key in first_row:
+            repeats.append((i, first_row[key]))
+            continue
+        first_row[key] = i
+        data["place_key"] = key
+        to_insert.append((i, DestinationInDB(**data).model_dump(by_alias=True, exclude=["id"])))
+
+    if to_insert:
+        result = await db.destinations.insert_many([doc for _, doc in to_insert])
+        for (i, _), inserted_id in zip(to_insert, result.inserted_ids):
+            results[i] = DestinationImportResult(row=i + 1, status="created", destination_id=str(inserted_id))
+    for i, first in repeats:
+        results[i] = DestinationImportResult(
+            row=i + 1, status="duplicate", destination_id=results[first].destination_id,
+            detail=f"Same place as row {first + 1}"
+        )
+
+    return DestinationImportResponse(
+        created=sum(r.status == "created" for r in results),
+        duplicates=sum(r.status == "duplicate" for r in results),
+        invalid=sum(r.status == "invalid" for r in results),
+        results=results
+    )
+
 @router.delete("/{destination_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_destination(
     destination_id: str,
@@ -74,6 +207,12 @@ async def delete_destination(
 
     # Delete
     await db.destinations.delete_one({"_id": oid})
+
+    # Schedules left pointing here no longer have a place to match on
+    await db.schedules.update_many({"destination_id": str(oid)}, {"$unset": {"place_key": ""}})
+    if schedule_index.ready:
+        orphaned = await db.schedules.find({"destination_id": str(oid)}, {"_id": 1}).to_list(None)
+        await refresh_schedules(str(s["_id"]) for s in orphaned)
     
     # Optional: We might want to warn if there are schedules using this destination,
     # but for now we'll allow it (schedules will just show un-enriched data or we handle it on fetch)
@@ -84,7 +223,6 @@ async def delete_destination(
 async def update_destination(
     destination_id: str,
     destination_update: DestinationUpdate,
-    background_tasks: BackgroundTasks,
     current_user: UserInDB = Depends(get_current_user)
 ):
     """
@@ -116,6 +254,10 @@ async def update_destination(
             # Override with verified data
             update_data.update(verified_data)
             update_data["verified_date"] = datetime.now(timezone.utc)
+    if "geo" in update_data:
+        update_data["location"] = geo_point(update_data["geo"])
+    if "name" in update_data or "google_place_id" in update_data or not destination.get("place_key"):
+        update_data["place_key"] = await resolve_place_key({**destination, **update_data})
         
     # Check if used in any past/completed schedules
     # "Past" means completed status OR pickup_time < now
@@ -148,30 +290,36 @@ async def update_destination(
         )
         
         # 3. Update ACTIVE/FUTURE schedules to point to NEW destination
+        # Still active as matching sees it: upcoming, or recurring (a daily/weekly
+        # schedule that started in the past keeps producing occurrences)
         active_schedules_cursor = db.schedules.find({
             "destination_id": str(oid),
             "status": {"$ne": "completed"},
-            "pickup_time": {"$gte": now}
+            "$or": [
+                {"pickup_time": {"$gte": now}},
+                {"recurrence": {"$in": list(RECURRENCE_STEPS)}}
+            ]
         })
         
-        active_schedules = await active_schedules_cursor.to_list(1000)
-        
-        for schedule in active_schedules:
-            sched_id = schedule["_id"]
-            
-            # Point to new destination
-            await db.schedules.update_one(
-                {"_id": sched_id},
-                {"$set": {"destination_id": str(new_dest_id)}}
+        active_schedules = await active_schedules_cursor.to_list(None)
+        rematch_ids = [str(s["_id"]) for s in active_schedules]
+
+        # Point to new destination (and its place) in one write
+        if active_schedules:
+            await db.schedules.update_many(
+                {"_id": {"$in": [s["_id"] for s in active_schedules]}},
+                {"$set": {"destination_id": str(new_dest_id), "place_key": new_dest_in_db.place_key}}
             )
-            
-            # INVALIDATE existing matches for this schedule since location changed
-            # We delete suggested/accepted matches because the location constraint is violated
-            # This ensures partners are notified if they had an accepted match
-            await invalidate_schedule_matches(str(sched_id), reason="destination changed")
-            
-            # Re-trigger matching
-            background_tasks.add_task(find_and_create_matches, str(sched_id))
+
+        # INVALIDATE existing matches for these schedules since location changed
+        # We delete suggested/accepted matches because the location constraint is violated
+        # This ensures partners are notified if they had an accepted match
+        await invalidate_schedule_matches_bulk(rematch_ids, reason="destination changed")
+
+        # Re-index and re-trigger matching for all affected schedules in one pass
+        await refresh_schedules(rematch_ids)
+        if rematch_ids:
+            await enqueue_matching(rematch_ids)
             
         # Return the NEW destination
         updated_destination = await db.destinations.find_one({"_id": new_dest_id})
@@ -183,22 +331,28 @@ async def update_destination(
             {"_id": oid},
             {"$set": update_data}
         )
+        if "place_key" in update_data:
+            await db.schedules.update_many(
+                {"destination_id": str(oid)},
+                {"$set": {"place_key": update_data["place_key"]}}
+            )
         
         # Invalidate matches for any ACTIVE schedules using this destination
         # (Since we modified the destination in place, existing matches might be invalid)
         active_schedules = await db.schedules.find({
             "destination_id": str(oid),
             "status": "active"
-        }).to_list(1000)
-        
-        for schedule in active_schedules:
-            sched_id = schedule["_id"]
-             # Delete existing matches as criteria changed
-             # This ensures partners are notified if they had an accepted match
-            await invalidate_schedule_matches(str(sched_id), reason="destination updated")
-            
-            # Re-trigger matching
-            background_tasks.add_task(find_and_create_matches, str(sched_id))
+        }, {"_id": 1}).to_list(None) # No cap: every one of them may have just changed place_key
+        rematch_ids = [str(s["_id"]) for s in active_schedules]
+
+        # Delete existing matches as criteria changed
+        # This ensures partners are notified if they had an accepted match
+        await invalidate_schedule_matches_bulk(rematch_ids, reason="destination updated")
+
+        # Re-index and re-trigger matching for all affected schedules in one pass
+        await refresh_schedules(rematch_ids)
+        if rematch_ids:
+            await enqueue_matching(rematch_ids)
 
         updated_destination = await db.destinations.find_one({"_id": oid})
         return updated_destination
\ No newline at end of file
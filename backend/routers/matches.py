@@ -1,17 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Body, BackgroundTasks
-from typing import List, Annotated
+from fastapi import APIRouter, Depends, HTTPException, status, Body, Query, Response
+from typing import List, Annotated, Optional
 from bson import ObjectId
 from pydantic import BaseModel
 from db import db
-from models import (
-    UserInDB,
-    RideMatchResponse,
-    UserResponse,
-    ScheduleEntryResponse,
-    DestinationResponse
-)
+from models import UserInDB, RideMatchResponse
 from auth import get_current_user
-from matching import find_and_create_matches
+from hydration import Hydrator, get_hydrator
+from pagination import paginate, set_next_cursor
+from services.events import publish_to_user
+from matching import enqueue_matching
 
 router = APIRouter()
 
@@ -19,56 +16,30 @@ class MatchUpdate(BaseModel):
     status: str
 
 @router.get("/", response_model=List[RideMatchResponse])
-async def list_matches(current_user: UserInDB = Depends(get_current_user)):
+async def list_matches(
+    response: Response,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user: UserInDB = Depends(get_current_user),
+    hydrator: Hydrator = Depends(get_hydrator)
+):
     """
-    List all ride matches for the current user (either as requester or provider).
+    List ride matches for the current user (either as requester or provider), newest first.
+    Pass the X-Next-Cursor response header back as `cursor` to get the next page.
     """
     # Find matches where user is requester or provider
-    matches = await db.matches.find({
+    matches, next_cursor = await paginate(db.matches, {
         "$or": [
             {"requester_id": str(current_user.id)},
             {"provider_id": str(current_user.id)}
         ]
-    }).to_list(1000)
-
-    enriched_matches = []
-    for m in matches:
-        # Fetch related data manually for MVP (no huge joins)
-        requester = await db.users.find_one({"_id": ObjectId(m["requester_id"])})
-        provider = await db.users.find_one({"_id": ObjectId(m["provider_id"])})
-        schedule = await db.schedules.find_one({"_id": ObjectId(m["schedule_entry_id"])})
-        
-        # Helper to safely create UserResponse
-        req_resp = UserResponse(**requester) if requester else None
-        prov_resp = UserResponse(**provider) if provider else None
-        
-        sched_resp = None
-        if schedule:
-            # We might need destination inside schedule too
-            dest_id = schedule.get("destination_id")
-            dest_resp = None
-            if dest_id:
-                dest = await db.destinations.find_one({"_id": ObjectId(dest_id)})
-                if dest:
-                    dest_resp = DestinationResponse(**dest)
-            
-            sched_resp = ScheduleEntryResponse(
-                **schedule,
-                destination=dest_resp
-            )
+    }, limit, cursor)
+    set_next_cursor(response, next_cursor)
 
-        enriched_matches.append(RideMatchResponse(
-            **m,
-            requester=req_resp,
-            provider=prov_resp,
-            schedule=sched_resp
-        ))
-
-    return enriched_matches
+    return await hydrator.hydrate_matches(matches)
 
 @router.post("/generate", response_model=dict)
 async def generate_matches(
-    background_tasks: BackgroundTasks,
     current_user: UserInDB = Depends(get_current_user)
 ):
     """
@@ -81,10 +52,11 @@ async def generate_matches(
         "status": "active"
     }).to_list(100)
     
-    count = 0
-    for s in schedules:
-        background_tasks.add_task(find_and_create_matches, str(s["_id"]))
-        count += 1
+    schedule_ids = [str(s["_id"]) for s in schedules]
+    count = len(schedule_ids)
+    if schedule_ids:
+        # Queued together, so workers match them in one set-based pass
+        await enqueue_matching(schedule_ids)
         
     return {"message": f"Triggered matching for {count} schedules", "count": count}
 
@@ -92,7 +64,8 @@ async def generate_matches(
 async def update_match_status(
     match_id: str,
     update: MatchUpdate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(get_current_user),
+    hydrator: Hydrator = Depends(get_hydrator)
 ):
     # Verify match exists and user is involved
     match = await db.matches.find_one({"_id": ObjectId(match_id)})
@@ -111,30 +84,11 @@ async def update_match_status(
     # Return updated match
     updated_match = await db.matches.find_one({"_id": ObjectId(match_id)})
     
-    requester = await db.users.find_one({"_id": ObjectId(updated_match["requester_id"])})
-    provider = await db.users.find_one({"_id": ObjectId(updated_match["provider_id"])})
-    schedule = await db.schedules.find_one({"_id": ObjectId(updated_match["schedule_entry_id"])})
+    hydrated = await hydrator.hydrate_matches([updated_match])
     
-    req_resp = UserResponse(**requester) if requester else None
-    prov_resp = UserResponse(**provider) if provider else None
+    # Push the new status to both parties
+    payload = hydrated[0].model_dump(mode="json", by_alias=True)
+    for user_id in {updated_match["requester_id"], updated_match["provider_id"]}:
+        await publish_to_user(user_id, "match_updated", payload)
     
-    sched_resp = None
-    if schedule:
-        dest_id = schedule.get("destination_id")
-        dest_resp = None
-        if dest_id:
-            dest = await db.destinations.find_one({"_id": ObjectId(dest_id)})
-            if dest:
-                dest_resp = DestinationResponse(**dest)
-        
-        sched_resp = ScheduleEntryResponse(
-            **schedule,
-            destination=dest_resp
-        )
-        
-    return RideMatchResponse(
-        **updated_match,
-        requester=req_resp,
-        provider=prov_resp,
-        schedule=sched_resp
-    )
\ No newline at end of file
+    return hydrated[0]
@@ -1,33 +1,105 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
-from bson import ObjectId
+import json
+from datetime import timedelta
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from config import settings
 from db import db
-from models import UserInDB, NotificationResponse
-from auth import get_current_user
+from models import UserInDB, NotificationResponse, NotificationMarkRead, UnreadCountResponse
+from auth import get_current_user, get_current_user_for_stream
+from pagination import LATEST_CURSOR_HEADER, encode_cursor, paginate, set_next_cursor
+from services.events import Subscription, get_broker, user_channel
+from services.notifications import mark_one_read, mark_read, unread_count
 
 router = APIRouter()
 
 @router.get("/", response_model=List[NotificationResponse])
-async def list_notifications(current_user: UserInDB = Depends(get_current_user)):
+async def list_notifications(
+    response: Response,
+    limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = None,
+    since: Optional[str] = None,
+    current_user: UserInDB = Depends(get_current_user)
+):
     """
-    List all notifications for the current user.
+    List notifications for the current user, newest first.
+    Pass the X-Next-Cursor response header back as `cursor` to get the next page.
+    Pass the X-Latest-Cursor response header back as `since` to get only newer items.
+    A `since` poll also repeats the last NOTIFICATION_SINCE_OVERLAP_SECONDS before the
+    cursor, because concurrent inserts can land out of order; dedupe by _id.
     """
-    notifications = await db.notifications.find({"user_id": current_user.id}).sort("created_at", -1).to_list(100)
+    notifications, next_cursor = await paginate(
+        db.notifications, {"user_id": current_user.id}, limit, cursor, since=since,
+        since_overlap=timedelta(seconds=settings.NOTIFICATION_SINCE_OVERLAP_SECONDS)
+    )
+    set_next_cursor(response, next_cursor)
+    if notifications and not cursor:
+        newest = notifications[0]
+        response.headers[LATEST_CURSOR_HEADER] = encode_cursor(newest.get("created_at"), newest["_id"])
+    elif since:
+        response.headers[LATEST_CURSOR_HEADER] = since
     return notifications
 
+@router.get("/unread-count", response_model=UnreadCountResponse)
+async def get_unread_count(current_user: UserInDB = Depends(get_current_user)):
+    """
+    Number of unread notifications for the current user.
+    """
+    return {"unread": await unread_count(current_user.id)}
+
+@router.get("/stream")
+async def stream_events(request: Request, current_user: UserInDB = Depends(get_current_user_for_stream)):
+    """
+    Server-Sent Events stream of notifications and match updates for the current user.
+    Browsers can pass the JWT as `?access_token=` since EventSource cannot set headers.
+    A `resync` event means events were dropped for a slow client; refetch with `since`.
+    """
+    subscription = await get_broker().subscribe(
+        user_channel(str(current_user.id)), settings.EVENT_STREAM_QUEUE_SIZE
+    )
+    return StreamingResponse(
+        _event_stream(request, subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _event_stream(request: Request, subscription: Subscription):
+    try:
+        yield "retry: 5000\n\n"
+        while not await request.is_disconnected():
+            event = await subscription.get(timeout=settings.EVENT_STREAM_KEEPALIVE_SECONDS)
+            if subscription.overflowed:
+                subscription.overflowed = False
+                yield "event: resync\ndata: {}\n\n"
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            event_id = event["data"].get("_id", "")
+            yield f"id: {event_id}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+    finally:
+        await subscription.close()
+
+@router.post("/read", response_model=UnreadCountResponse)
+async def mark_notifications_read(
+    request: NotificationMarkRead,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Mark notifications as read: all of them, or the given ids.
+    Returns the remaining unread count.
+    """
+    if not request.all and not request.ids:
+        raise HTTPException(status_code=400, detail="Provide 'all': true or a list of 'ids'")
+
+    await mark_read(current_user.id, None if request.all else request.ids)
+    return {"unread": await unread_count(current_user.id)}
+
 @router.patch("/{notification_id}/read", response_model=NotificationResponse)
 async def mark_notification_read(notification_id: str, current_user: UserInDB = Depends(get_current_user)):
     """
     Mark a notification as read.
     """
-    notification = await db.notifications.find_one({"_id": ObjectId(notification_id), "user_id": current_user.id})
+    notification = await mark_one_read(current_user.id, notification_id)
     if not notification:
         raise HTTPException(status_code=404, detail="Notification not found")
-        
-    await db.notifications.update_one(
-        {"_id": ObjectId(notification_id)},
-        {"$set": {"is_read": True}}
-    )
-    
-    updated_notification = await db.notifications.find_one({"_id": ObjectId(notification_id)})
-    return updated_notification
\ No newline at end of file
+    return notification
@@ -1,51 +1,50 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response, Body
 from typing import List, Optional
 from bson import ObjectId
 from bson.errors import InvalidId
 from db import db
+from config import settings
 from models import (
     UserInDB,
     ScheduleEntryCreate,
     ScheduleEntryResponse,
     ScheduleEntryInDB,
-    DestinationResponse,
     ScheduleEntryUpdate
 )
 from auth import get_current_user
+from hydration import Hydrator, get_hydrator
+from pagination import paginate, set_next_cursor
+from utils import to_object_ids
 
-from matching import find_and_create_matches, invalidate_schedule_matches
+from matching import enqueue_matching, invalidate_schedule_matches_bulk
+from places import destination_place_key
+from schedule_index import index_schedule, unindex_schedule
 
 router = APIRouter()
 
 @router.get("/", response_model=List[ScheduleEntryResponse])
-async def list_schedules(current_user: UserInDB = Depends(get_current_user)):
+async def list_schedules(
+    response: Response,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user: UserInDB = Depends(get_current_user),
+    hydrator: Hydrator = Depends(get_hydrator)
+):
     """
-    List all schedules for the current user.
+    List schedules for the current user, newest first.
+    Pass the X-Next-Cursor response header back as `cursor` to get the next page.
     """
-    schedules = await db.schedules.find({"user_id": str(current_user.id)}).to_list(1000)
+    schedules, next_cursor = await paginate(db.schedules, {"user_id": str(current_user.id)}, limit, cursor)
+    set_next_cursor(response, next_cursor)
     
-    # Enrich with destination details
-    enriched_schedules = []
-    for s in schedules:
-        dest_id = s.get("destination_id")
-        destination = None
-        if dest_id:
-            dest_data = await db.destinations.find_one({"_id": ObjectId(dest_id)})
-            if dest_data:
-                destination = DestinationResponse(**dest_data)
-        
-        enriched_schedules.append(ScheduleEntryResponse(
-            **s,
-            destination=destination
-        ))
-        
-    return enriched_schedules
+    # Enrich with destination details (one $in query for all destinations)
+    return await hydrator.hydrate_schedules(schedules)
 
 @router.post("/", response_model=ScheduleEntryResponse, status_code=status.HTTP_201_CREATED)
 async def create_schedule(
     schedule: ScheduleEntryCreate,
-    background_tasks: BackgroundTasks,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(get_current_user),
+    hydrator: Hydrator = Depends(get_hydrator)
 ):
     """
     Create a new schedule entry.
@@ -57,6 +56,7 @@ async def create_schedule(
 
     schedule_data = schedule.model_dump()
     schedule_data["user_id"] = str(current_user.id)
+    schedule_data["place_key"] = destination_place_key(destination)
     
     # Create DB model
     new_schedule = ScheduleEntryInDB(**schedule_data)
@@ -67,19 +67,68 @@ async def create_schedule(
     # Fetch created schedule
     created_schedule_doc = await db.schedules.find_one({"_id": result.inserted_id})
     
-    # Enrich with destination for response
-    destination_resp = DestinationResponse(**destination)
-    
-    response = ScheduleEntryResponse(
-        **created_schedule_doc,
-        destination=destination_resp
-    )
+    # Enrich with destination for response (already loaded above)
+    hydrator.add_destinations([destination])
+    response = hydrator.schedule_from_doc(created_schedule_doc)
+    index_schedule(created_schedule_doc, destination)
     
     # Trigger matching algorithm
-    background_tasks.add_task(find_and_create_matches, str(result.inserted_id))
+    await enqueue_matching([str(result.inserted_id)])
     
     return response
 
+@router.post("/bulk", response_model=List[ScheduleEntryResponse], status_code=status.HTTP_201_CREATED)
+async def create_schedules_bulk(
+    schedules: List[ScheduleEntryCreate] = Body(...),
+    current_user: UserInDB = Depends(get_current_user),
+    hydrator: Hydrator = Depends(get_hydrator)
+):
+    """
+    Create many schedule entries at once (e.g. a whole term of pickups).
+    All entries are validated before anything is written; they are inserted together
+    and matched in a single pass.
+    """
+    if not schedules:
+        return []
+    if len(schedules) > settings.SCHEDULE_BULK_MAX_ENTRIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.SCHEDULE_BULK_MAX_ENTRIES} schedules can be created at once"
+        )
+
+    # Verify every destination exists (one $in query)
+    destination_ids = {s.destination_id for s in schedules}
+    destinations = await db.destinations.find({"_id": {"$in": to_object_ids(destination_ids)}}).to_list(None)
+    destinations_by_id = {str(d["_id"]): d for d in destinations}
+    missing = sorted(destination_ids - set(destinations_by_id))
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Destination not found: {', '.join(missing)}")
+
+    documents = []
+    for schedule in schedules:
+        schedule_data = schedule.model_dump()
+        schedule_data["user_id"] = str(current_user.id)
+        schedule_data["place_key"] = destination_place_key(destinations_by_id[schedule.destination_id])
+        documents.append(ScheduleEntryInDB(**schedule_data).model_dump(by_alias=True, exclude={"id"}))
+
+    result = await db.schedules.insert_many(documents)
+
+    # Fetch the created schedules (one $in query) so times come back as stored, in milliseconds
+    created = await db.schedules.find({"_id": {"$in": result.inserted_ids}}).to_list(None)
+    created_by_id = {doc["_id"]: doc for doc in created}
+
+    hydrator.add_destinations(destinations)
+    response = []
+    for inserted_id in result.inserted_ids:
+        doc = created_by_id[inserted_id]
+        response.append(hydrator.schedule_from_doc(doc))
+        index_schedule(doc, destinations_by_id[doc["destination_id"]])
+
+    # Queued together, so workers match the batch in one pass
+    await enqueue_matching([str(i) for i in result.inserted_ids])
+
+    return response
+
 @router.delete("/{schedule_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_schedule(
     schedule_id: str,
@@ -100,11 +149,12 @@ async def delete_schedule(
 
     # INVALIDATE matches before deleting
     # This ensures partners are notified if they had an accepted match
-    await invalidate_schedule_matches(schedule_id, reason="schedule deleted")
+    await invalidate_schedule_matches_bulk([schedule_id], reason="schedule deleted")
 
     result = await db.schedules.delete_one({
         "_id": oid
     })
+    unindex_schedule(schedule_id)
     
     return None
 
@@ -112,8 +162,8 @@ async def delete_schedule(
 async def update_schedule(
     schedule_id: str,
     schedule_update: ScheduleEntryUpdate,
-    background_tasks: BackgroundTasks,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(get_current_user),
+    hydrator: Hydrator = Depends(get_hydrator)
 ):
     """
     Update a schedule entry.
@@ -132,19 +182,16 @@ async def update_schedule(
     
     if not update_data:
         # Just return existing enriched
-        dest_id = existing_schedule.get("destination_id")
-        destination = None
-        if dest_id:
-             dest_data = await db.destinations.find_one({"_id": ObjectId(dest_id)})
-             if dest_data:
-                 destination = DestinationResponse(**dest_data)
-        return ScheduleEntryResponse(**existing_schedule, destination=destination)
+        hydrated = await hydrator.hydrate_schedules([existing_schedule])
+        return hydrated[0]
 
     # If destination is changing, verify it exists
     if "destination_id" in update_data:
         destination = await db.destinations.find_one({"_id": ObjectId(update_data["destination_id"])})
         if not destination:
             raise HTTPException(status_code=404, detail="Destination not found")
+        hydrator.add_destinations([destination])
+        update_data["place_key"] = destination_place_key(destination)
             
     # Update DB
     await db.schedules.update_one(
@@ -155,21 +202,17 @@ async def update_schedule(
     # Fetch updated
     updated_schedule_doc = await db.schedules.find_one({"_id": oid})
     
-    # Enrich
-    dest_id = updated_schedule_doc.get("destination_id")
-    destination_resp = None
-    if dest_id:
-        dest_data = await db.destinations.find_one({"_id": ObjectId(dest_id)})
-        if dest_data:
-            destination_resp = DestinationResponse(**dest_data)
+    # Enrich (reuses the destination verified above when it changed)
+    hydrated = await hydrator.hydrate_schedules([updated_schedule_doc])
+    index_schedule(updated_schedule_doc, hydrator.destination_doc(updated_schedule_doc.get("destination_id")))
             
     # Trigger matching if critical fields changed
     if any(k in update_data for k in ["destination_id", "pickup_time", "recurrence"]):
          # INVALIDATE existing matches because core criteria changed
          # This ensures partners are notified if they had an accepted match
-         await invalidate_schedule_matches(schedule_id, reason="schedule updated")
+         await invalidate_schedule_matches_bulk([schedule_id], reason="schedule updated")
          
          # Re-trigger matching
-         background_tasks.add_task(find_and_create_matches, str(oid))
+         await enqueue_matching([str(oid)])
 
-    return ScheduleEntryResponse(**updated_schedule_doc, destination=destination_resp)
\ No newline at end of file
+    return hydrated[0]
\ No newline at end of file
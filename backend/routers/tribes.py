@@ -10,6 +10,9 @@ from models import (
 )
 from datetime import datetime
 from auth import get_current_user
+from hydration import Hydrator, get_hydrator
+from peers import refresh_tribe_peers
+from services.notifications import create_notification
 
 router = APIRouter()
 
@@ -18,7 +21,10 @@ async def debug_ping():
     return {"ping": "pong", "time": "now"}
 
 @router.get("/", response_model=List[TribeResponse])
-async def list_tribes(current_user: UserInDB = Depends(get_current_user)):
+async def list_tribes(
+    current_user: UserInDB = Depends(get_current_user),
+    hydrator: Hydrator = Depends(get_hydrator)
+):
     # Find all memberships for the user
     memberships = await db.tribe_memberships.find({"user_id": str(current_user.id)}).to_list(100)
     
@@ -32,6 +38,10 @@ async def list_tribes(current_user: UserInDB = Depends(get_current_user)):
         
     tribes = await db.tribes.find({"_id": {"$in": tribe_ids}}).to_list(100)
     
+    # Load all inviters in one query
+    membership_map = {m["tribe_id"]: m for m in reversed(memberships)}
+    await hydrator.load_users(m.get("invited_by_id") for m in memberships)
+    
     # Enrich tribes with status
     for tribe in tribes:
         tid = str(tribe["_id"])
@@ -39,20 +49,16 @@ async def list_tribes(current_user: UserInDB = Depends(get_current_user)):
             tribe["membership_status"] = status_map[tid]
             
             # Populate invited_by_name if available
-            membership = next((m for m in memberships if m["tribe_id"] == tid), None)
+            membership = membership_map.get(tid)
             if membership and membership.get("invited_by_id"):
-                inviter = await db.users.find_one({"_id": ObjectId(membership["invited_by_id"])})
+                inviter = hydrator.user_doc(membership["invited_by_id"])
                 if inviter:
                     tribe["invited_by_name"] = inviter["name"]
             
     return tribes
 
-from fastapi import Request
-
 @router.post("/", response_model=TribeResponse)
-async def create_tribe(tribe: TribeCreate, request: Request, current_user: UserInDB = Depends(get_current_user)):
-    print(f"DEBUG: create_tribe called. Name: {tribe.name}, User: {current_user.phone}")
-    print(f"DEBUG: Request headers: {request.headers}")
+async def create_tribe(tribe: TribeCreate, current_user: UserInDB = Depends(get_current_user)):
     # Create tribe document
     tribe_in_db = TribeInDB(
         name=tribe.name,
@@ -75,7 +81,11 @@ async def create_tribe(tribe: TribeCreate, request: Request, current_user: UserI
     return created_tribe
 
 @router.get("/{tribe_id}/members", response_model=List[TribeMemberResponse])
-async def list_tribe_members(tribe_id: str, current_user: UserInDB = Depends(get_current_user)):
+async def list_tribe_members(
+    tribe_id: str,
+    current_user: UserInDB = Depends(get_current_user),
+    hydrator: Hydrator = Depends(get_hydrator)
+):
     # Verify user is a member of this tribe
     membership = await db.tribe_memberships.find_one({
         "tribe_id": tribe_id,
@@ -91,13 +101,14 @@ async def list_tribe_members(tribe_id: str, current_user: UserInDB = Depends(get
     # Get all memberships for this tribe
     tribe_memberships = await db.tribe_memberships.find({"tribe_id": tribe_id}).to_list(100)
     
-    # Get user details for each member
+    # Get user details for all members in one query
+    await hydrator.load_users(m["user_id"] for m in tribe_memberships)
     members = []
     for m in tribe_memberships:
-        user = await db.users.find_one({"_id": ObjectId(m["user_id"])})
+        user = hydrator.user(m["user_id"])
         if user:
             members.append(TribeMemberResponse(
-                user=UserResponse(**user),
+                user=user,
                 trust_level=m["trust_level"],
                 status=m["status"],
                 joined_at=m["created_at"]
@@ -130,7 +141,6 @@ async def invite_member(
     invite: TribeInvite,
     current_user: UserInDB = Depends(get_current_user)
 ):
-    print(f"DEBUG: invite_member called for tribe_id={tribe_id}, invite={invite}")
     # Check if tribe exists
     tribe = await db.tribes.find_one({"_id": ObjectId(tribe_id)})
     if not tribe:
@@ -144,7 +154,6 @@ async def invite_member(
         )
         
     # Find user by phone
-    print(f"DEBUG: searching for user with phone: {invite.phone_number}")
     user_to_invite = await db.users.find_one({"phone": invite.phone_number})
     if not user_to_invite:
         # User requirement: "if a number is not registered then invite should not go to him"
@@ -175,6 +184,7 @@ async def invite_member(
     )
     
     await db.tribe_memberships.insert_one(new_membership.model_dump(by_alias=True, exclude={"id"}))
+    await refresh_tribe_peers([tribe_id])
     
     # Note: We do NOT increment member_count here anymore, only upon acceptance
     
@@ -185,8 +195,7 @@ async def invite_member(
         message=f"You have been invited by {current_user.name} to join the tribe '{tribe['name']}'!",
         related_id=tribe_id
     )
-    print(f"DEBUG: Notification Message Generated: {notification.message}")
-    await db.notifications.insert_one(notification.model_dump(by_alias=True, exclude={"id"}))
+    await create_notification(notification)
 
     return TribeMemberResponse(
         user=UserResponse(**user_to_invite),
@@ -201,14 +210,6 @@ async def remove_member(
     user_id: str,
     current_user: UserInDB = Depends(get_current_user)
 ):
-    with open("debug_hit.txt", "w") as f:
-        f.write(f"HIT remove_member: tribe_id={tribe_id}, user_id={user_id}\n")
-    
-    print(f"DEBUG: remove_member HIT! tribe_id={tribe_id}, user_id={user_id}")
-    logging.info(f"DEBUG: remove_member called with tribe_id={tribe_id}, user_id={user_id}")
-    all_memberships = await db.tribe_memberships.find({"tribe_id": tribe_id}).to_list(100)
-    logging.info(f"DEBUG: All memberships for tribe {tribe_id}: {all_memberships}")
-    
     # Check if tribe exists
     try:
         tribe = await db.tribes.find_one({"_id": ObjectId(tribe_id)})
@@ -262,6 +263,7 @@ async def remove_member(
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=500, detail="Failed to delete membership despite finding it")
+    await refresh_tribe_peers([tribe_id], extra_user_ids=[user_id])
         
     # Decrement member count
     await db.tribes.update_one(
@@ -304,6 +306,7 @@ async def update_member_trust(
         {"_id": membership["_id"]},
         {"$set": {"trust_level": update.trust_level}}
     )
+    await refresh_tribe_peers([tribe_id])
     
     # Fetch updated membership details for response
     updated_membership = await db.tribe_memberships.find_one({"_id": membership["_id"]})
@@ -360,6 +363,7 @@ async def respond_to_invite(
         )
     else:
         raise HTTPException(status_code=400, detail="Invalid status")
+    await refresh_tribe_peers([tribe_id])
 
     updated_membership = await db.tribe_memberships.find_one({"_id": membership["_id"]})
     user = await db.users.find_one({"_id": ObjectId(current_user.id)})
@@ -0,0 +1,227 @@
+import bisect
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from db import db
+from places import destination_place_key
+from recurrence import is_recurring
+from utils import as_utc, to_object_ids
+
+logger = logging.getLogger(__name__)
+
+# Width of a pickup-time bucket. A +/- 15 minute probe touches at most two buckets.
+BUCKET_SECONDS = 3600
+
+class IndexedSchedule(NamedTuple):
+    schedule_id: str
+    user_id: str
+    destination_id: str
+    pickup_ts: float
+    recurrence: str
+    keys: Tuple[str, ...]
+
+    def as_doc(self) -> dict:
+        """Shape expected by matching (subset of a schedules document)."""
+        return {
+            "_id": self.schedule_id,
+            "user_id": self.user_id,
+            "destination_id": self.destination_id,
+            "pickup_time": datetime.fromtimestamp(self.pickup_ts, tz=timezone.utc),
+            "recurrence": self.recurrence,
+            "status": "active"
+        }
+
+def _timestamp(value: datetime) -> float:
+    return as_utc(value).timestamp()
+
+def index_keys(schedule: dict, destination: Optional[dict]) -> Tuple[str, ...]:
+    """
+    Keys a schedule is stored under: its canonical place key, as matched by Mongo
+    on schedules.place_key (derived from the destination for rows not yet backfilled).
+    """
+    key = schedule.get("place_key") or destination_place_key(destination)
+    return (key,) if key else ()
+
+class ScheduleIndex:
+    """
+    In-process index of active schedules, keyed by canonical place and bucketed by
+    pickup time, so candidate lookup is a dict + bisect probe instead of a query.
+    Recurring schedules are kept in a separate per-place set since their first
+    pickup time says nothing about later occurrences.
+
+    The index only sees writes made by this process: run a single API worker when
+    it is enabled, and use check_consistency() to detect drift against Mongo.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._entries: Dict[str, IndexedSchedule] = {}
+        # place key -> bucket number -> sorted [(pickup_ts, schedule_id)]
+        self._buckets: Dict[str, Dict[int, List[Tuple[float, str]]]] = defaultdict(dict)
+        # place key -> ids of recurring schedules
+        self._recurring: Dict[str, Set[str]] = defaultdict(set)
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def warm(self, database=None):
+        """Rebuild the index from every active schedule in Mongo."""
+        database = database if database is not None else db
+        schedules = await database.schedules.find({"status": "active"}).to_list(None)
+        dest_ids = {s.get("destination_id") for s in schedules}
+        destinations = await database.destinations.find({"_id": {"$in": to_object_ids(dest_ids)}}).to_list(None)
+        destinations_by_id = {str(d["_id"]): d for d in destinations}
+
+        self._entries.clear()
+        self._buckets.clear()
+        self._recurring.clear()
+        for s in schedules:
+            self.upsert(s, destinations_by_id.get(s.get("destination_id")))
+        self.ready = True
+        logger.info(f"Schedule index warmed with {len(self._entries)} active schedules")
+
+    def upsert(self, schedule: dict, destination: Optional[dict]):
+        """Index (or re-index) a schedule document; inactive or unplaceable schedules are dropped."""
+        schedule_id = str(schedule["_id"])
+        self.remove(schedule_id)
+        keys = index_keys(schedule, destination)
+        if schedule.get("status", "active") != "active" or not schedule.get("pickup_time") or not keys:
+            return
+
+        entry = IndexedSchedule(
+            schedule_id=schedule_id,
+            user_id=schedule["user_id"],
+            destination_id=schedule["destination_id"],
+            pickup_ts=_timestamp(schedule["pickup_time"]),
+            recurrence=schedule.get("recurrence", "once"),
+            keys=keys
+        )
+        self._entries[schedule_id] = entry
+        if is_recurring(entry.recurrence):
+            for key in entry.keys:
+                self._recurring[key].add(schedule_id)
+            return
+        bucket = int(entry.pickup_ts // BUCKET_SECONDS)
+        for key in entry.keys:
+            bisect.insort(self._buckets[key].setdefault(bucket, []), (entry.pickup_ts, schedule_id))
+
+    def remove(self, schedule_id: str):
+        entry = self._entries.pop(str(schedule_id), None)
+        if not entry:
+            return
+        if is_recurring(entry.recurrence):
+            for key in entry.keys:
+                self._recurring[key].discard(entry.schedule_id)
+            return
+        bucket = int(entry.pickup_ts // BUCKET_SECONDS)
+        for key in entry.keys:
+            items = self._buckets[key].get(bucket, [])
+            i = bisect.bisect_left(items, (entry.pickup_ts, entry.schedule_id))
+            if i < len(items) and items[i][1] == entry.schedule_id:
+                items.pop(i)
+            if not items:
+                self._buckets[key].pop(bucket, None)
+
+    def remove_user(self, user_id: str):
+        for entry in [e for e in self._entries.values() if e.user_id == user_id]:
+            self.remove(entry.schedule_id)
+
+    def candidates(
+        self,
+        key: str,
+        user_ids: Set[str],
+        earliest: datetime,
+        latest: datetime
+    ) -> List[IndexedSchedule]:
+        """
+        Active schedules at `key` owned by `user_ids` that may occur in [earliest, latest]:
+        one-off schedules picked up in that range plus recurring schedules starting by `latest`.
+        """
+        lo = _timestamp(earliest)
+        hi = _timestamp(latest)
+
+        found = [
+            self._entries[schedule_id] for schedule_id in self._recurring.get(key, ())
+            if self._entries[schedule_id].user_id in user_ids and self._entries[schedule_id].pickup_ts <= hi
+        ]
+
+        buckets = self._buckets.get(key)
+        if not buckets:
+            return found
+        for bucket in range(int(lo // BUCKET_SECONDS), int(hi // BUCKET_SECONDS) + 1):
+            items = buckets.get(bucket)
+            if not items:
+                continue
+            start = bisect.bisect_left(items, (lo, ""))
+            for ts, schedule_id in items[start:]:
+                if ts > hi:
+                    break
+                entry = self._entries[schedule_id]
+                if entry.user_id in user_ids:
+                    found.append(entry)
+        return found
+
+    async def check_consistency(self, database=None) -> dict:
+        """
+        Compare the index against Mongo. Returns counts plus up to 20 ids for each of:
+        missing (active in Mongo, not indexed), extra (indexed, not active in Mongo)
+        and stale (indexed with a different user, destination, time or place).
+        """
+        database = database if database is not None else db
+        reference = ScheduleIndex()
+        await reference.warm(database)
+
+        ours = set(self._entries)
+        theirs = set(reference._entries)
+        missing = sorted(theirs - ours)
+        extra = sorted(ours - theirs)
+        stale = sorted(
+            sid for sid in ours & theirs
+            if self._entries[sid] != reference._entries[sid]
+        )
+        return {
+            "consistent": not (missing or extra or stale),
+            "indexed": len(ours),
+            "active_in_db": len(theirs),
+            "missing": missing[:20],
+            "extra": extra[:20],
+            "stale": stale[:20],
+            "missing_count": len(missing),
+            "extra_count": len(extra),
+            "stale_count": len(stale),
+        }
+
+schedule_index = ScheduleIndex()
+
+# Write-path hooks for routers. All are no-ops until the index has been warmed,
+# i.e. when SCHEDULE_INDEX_ENABLED is off.
+
+def index_schedule(schedule: dict, destination: Optional[dict]):
+    if schedule_index.ready:
+        schedule_index.upsert(schedule, destination)
+
+def unindex_schedule(schedule_id: str):
+    if schedule_index.ready:
+        schedule_index.remove(schedule_id)
+
+def unindex_user(user_id: str):
+    if schedule_index.ready:
+        schedule_index.remove_user(user_id)
+
+async def refresh_schedules(schedule_ids: Iterable[str]):
+    """Re-read schedules (and their destinations) from Mongo and re-index them."""
+    if not schedule_index.ready:
+        return
+    ids = [str(i) for i in schedule_ids]
+    schedules = await db.schedules.find({"_id": {"$in": to_object_ids(ids)}}).to_list(None)
+    dest_ids = {s.get("destination_id") for s in schedules}
+    destinations = await db.destinations.find({"_id": {"$in": to_object_ids(dest_ids)}}).to_list(None)
+    destinations_by_id = {str(d["_id"]): d for d in destinations}
+
+    found = set()
+    for s in schedules:
+        found.add(str(s["_id"]))
+        schedule_index.upsert(s, destinations_by_id.get(s.get("destination_id")))
+    for sid in set(ids) - found:
+        schedule_index.remove(sid)
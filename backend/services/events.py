@@ -0,0 +1,100 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+def user_channel(user_id: str) -> str:
+    return f"user:{user_id}"
+
+class Subscription:
+    """
+    One connection's view of a channel. Events are buffered in a bounded queue;
+    when a slow client lets it fill up the oldest events are dropped and the
+    subscription is flagged so the client can be told to resync.
+    """
+
+    def __init__(self, broker: "Broker", channel: str, max_queue: int):
+        self.broker = broker
+        self.channel = channel
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.overflowed = False
+
+    def deliver(self, event: dict):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            self.overflowed = True
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: float) -> Optional[dict]:
+        """Next event, or None if nothing arrived within `timeout` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        await self.broker.unsubscribe(self)
+
+class Broker(ABC):
+    """
+    Pub/sub fan-out for push events. The in-memory broker only reaches clients
+    connected to the same process; a shared implementation (e.g. Redis pub/sub or
+    a Mongo change stream) can be installed with set_broker() for multiple workers.
+    """
+
+    @abstractmethod
+    async def publish(self, channel: str, event: dict):
+        ...
+
+    @abstractmethod
+    async def subscribe(self, channel: str, max_queue: int) -> Subscription:
+        ...
+
+    @abstractmethod
+    async def unsubscribe(self, subscription: Subscription):
+        ...
+
+class InMemoryBroker(Broker):
+
+    def __init__(self):
+        self._subscriptions: Dict[str, Set[Subscription]] = defaultdict(set)
+
+    async def publish(self, channel: str, event: dict):
+        for subscription in list(self._subscriptions.get(channel, ())):
+            subscription.deliver(event)
+
+    async def subscribe(self, channel: str, max_queue: int) -> Subscription:
+        subscription = Subscription(self, channel, max_queue)
+        self._subscriptions[channel].add(subscription)
+        return subscription
+
+    async def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscriptions.get(subscription.channel)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscriptions[subscription.channel]
+
+    def connection_count(self) -> int:
+        return sum(len(s) for s in self._subscriptions.values())
+
+_broker: Broker = InMemoryBroker()
+
+def get_broker() -> Broker:
+    return _broker
+
+def set_broker(broker: Broker):
+    global _broker
+    _broker = broker
+
+async def publish_to_user(user_id: str, event_type: str, data: dict):
+    """Publish an event to a user's channel. Failures are logged, never raised to the writer."""
+    try:
+        await _broker.publish(user_channel(user_id), {"type": event_type, "data": data})
+    except Exception as e:
+        logger.error(f"Failed to publish {event_type} to user {user_id}: {e}")
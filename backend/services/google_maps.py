@@ -1,9 +1,51 @@
+import asyncio
+import copy
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
 import httpx
+from pymongo.errors import PyMongoError
+from cache import TTLCache
 from config import settings
+from db import db
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Place ids rarely change what they point to, so verified details are cached for a
+# long time: in-process first, then in the `place_details` collection shared by all
+# workers. Concurrent lookups of the same place share one in-flight request.
+place_details_cache = TTLCache(
+    max_size=settings.PLACE_DETAILS_CACHE_MAX_SIZE,
+    ttl_seconds=settings.PLACE_DETAILS_CACHE_TTL_SECONDS
+)
+_inflight: Dict[str, asyncio.Task] = {}
+_client: Optional[httpx.AsyncClient] = None
+
+# Google statuses worth retrying; anything else (NOT_FOUND, INVALID_REQUEST, ...) is final
+_RETRY_STATUSES = {"OVER_QUERY_LIMIT", "UNKNOWN_ERROR"}
+
+class _RetryableError(Exception):
+    pass
+
+def start_client():
+    """Create the pooled HTTP client. Called on app startup."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=settings.GOOGLE_MAPS_BASE_URL,
+            timeout=httpx.Timeout(settings.GOOGLE_MAPS_TIMEOUT_SECONDS),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+        )
+    return _client
+
+async def close_client():
+    """Close the pooled HTTP client. Called on app shutdown."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
 async def get_place_details(place_id: str):
     """
     Fetches place details from Google Places API.
@@ -14,23 +56,67 @@ async def get_place_details(place_id: str):
         logger.warning("GOOGLE_MAPS_API_KEY is not set. Skipping verification.")
         return None
 
-    url = "https://maps.googleapis.com/maps/api/place/details/json"
+    # Callers get their own copy; cached dicts are shared
+    details = place_details_cache.get(place_id)
+    if details is not None:
+        return copy.deepcopy(details)
+
+    task = _inflight.get(place_id)
+    if task is None:
+        task = asyncio.create_task(_load_place_details(place_id))
+        _inflight[place_id] = task
+        task.add_done_callback(lambda _: _inflight.pop(place_id, None))
+    # Shielded so one caller going away does not cancel the lookup for the others
+    return copy.deepcopy(await asyncio.shield(task))
+
+async def _load_place_details(place_id: str):
+    # The shared cache is an optimization: if Mongo is unavailable, go to Google instead
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.PLACE_DETAILS_CACHE_TTL_SECONDS)
+    try:
+        cached = await db.place_details.find_one({"_id": place_id, "fetched_at": {"$gte": cutoff}})
+    except PyMongoError as e:
+        logger.warning(f"Failed to read cached place details for {place_id}: {e}")
+        cached = None
+    if cached:
+        place_details_cache.set(place_id, cached["details"])
+        return cached["details"]
+
+    details = await _fetch_place_details(place_id)
+    if details is not None:
+        place_details_cache.set(place_id, details)
+        try:
+            await db.place_details.update_one(
+                {"_id": place_id},
+                {"$set": {"details": details, "fetched_at": datetime.now(timezone.utc)}},
+                upsert=True
+            )
+        except PyMongoError as e:
+            logger.warning(f"Failed to cache place details for {place_id}: {e}")
+    return details
+
+async def _fetch_place_details(place_id: str):
+    """Call the Places API, retrying transient failures with jittered exponential backoff."""
     params = {
         "place_id": place_id,
         "key": settings.GOOGLE_MAPS_API_KEY,
         "fields": "name,formatted_address,geometry"
     }
+    client = start_client()
 
-    async with httpx.AsyncClient() as client:
+    for attempt in range(settings.GOOGLE_MAPS_MAX_RETRIES + 1):
         try:
-            response = await client.get(url, params=params)
+            response = await client.get("/place/details/json", params=params)
+            if response.status_code == 429 or response.status_code >= 500:
+                raise _RetryableError(f"HTTP {response.status_code}")
             response.raise_for_status()
             data = response.json()
-            
+
+            if data.get("status") in _RETRY_STATUSES:
+                raise _RetryableError(data.get("status"))
             if data.get("status") != "OK":
                 logger.error(f"Google Places API Error for place_id {place_id}: {data.get('status')} - {data.get('error_message')}")
                 return None
-                
+
             result = data.get("result", {})
             return {
                 "name": result.get("name"),
@@ -40,6 +126,13 @@ async def get_place_details(place_id: str):
                     "lng": result.get("geometry", {}).get("location", {}).get("lng")
                 }
             }
+        except (_RetryableError, httpx.TransportError) as e:
+            if attempt >= settings.GOOGLE_MAPS_MAX_RETRIES:
+                logger.error(f"Failed to fetch place details for {place_id} after {attempt + 1} attempts: {e}")
+                return None
+            delay = random.uniform(0, settings.GOOGLE_MAPS_RETRY_BASE_SECONDS * 2 ** attempt)
+            logger.warning(f"Retrying place details for {place_id} in {delay:.2f}s: {e}")
+            await asyncio.sleep(delay)
         except Exception as e:
             logger.error(f"Failed to fetch place details: {e}")
-            return None
\ No newline at end of file
+            return None
@@ -0,0 +1,109 @@
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from db import db
+from models import NotificationInDB, NotificationResponse
+from services.events import publish_to_user
+from utils import to_object_ids
+
+# Every notification write goes through this module so the per-user unread
+# counters in `notification_counters` stay in step with `notifications`.
+#
+# notification_counters document: {_id: user_id, unread, seeded, version}
+# `version` is bumped by every counter write, so a lazy recount can tell whether
+# the counter moved while it was counting.
+
+SEED_ATTEMPTS = 3
+
+async def create_notifications(notifications: List[NotificationInDB]) -> List[str]:
+    """Insert notifications in one batch and bump each recipient's unread counter."""
+    if not notifications:
+        return []
+    # Stamped at insert rather than when the batch was built, so a slow batch cannot
+    # land far behind newer notifications that `since` pollers have already seen
+    created_at = datetime.utcnow()
+    docs = [{**n.model_dump(by_alias=True, exclude={"id"}), "created_at": created_at} for n in notifications]
+    result = await db.notifications.insert_many(docs)
+
+    unread = Counter(n.user_id for n in notifications if not n.is_read)
+    if unread:
+        await db.notification_counters.bulk_write([
+            UpdateOne({"_id": user_id}, {"$inc": {"unread": count, "version": 1}}, upsert=True)
+            for user_id, count in unread.items()
+        ], ordered=False)
+
+    # Push to connected clients (insert_many sets _id on each doc)
+    for doc in docs:
+        await publish_to_user(
+            doc["user_id"], "notification", NotificationResponse(**doc).model_dump(mode="json", by_alias=True)
+        )
+    return [str(i) for i in result.inserted_ids]
+
+async def create_notification(notification: NotificationInDB) -> str:
+    ids = await create_notifications([notification])
+    return ids[0]
+
+async def unread_count(user_id: str) -> int:
+    """
+    Unread notifications for a user, read from the maintained counter. Counters
+    created before this one existed (or by an $inc upsert) are recounted once; the
+    recount is only stored if no counter write landed while counting.
+    """
+    count = 0
+    for _ in range(SEED_ATTEMPTS):
+        counter = await db.notification_counters.find_one({"_id": user_id})
+        if counter and counter.get("seeded"):
+            return max(counter.get("unread", 0), 0)
+
+        count = await db.notifications.count_documents({"user_id": user_id, "is_read": False})
+        seed = {"unread": count, "seeded": True}
+        if counter is None:
+            try:
+                await db.notification_counters.insert_one({"_id": user_id, **seed, "version": 0})
+                return count
+            except DuplicateKeyError:
+                continue # Created meanwhile by an $inc upsert or another recount
+        result = await db.notification_counters.update_one(
+            {"_id": user_id, "seeded": {"$ne": True}, "version": counter.get("version")},
+            {"$set": seed}
+        )
+        if result.modified_count:
+            return count
+    # Still moving; answer from this count and seed on a later call
+    return count
+
+async def mark_read(user_id: str, notification_ids: Optional[List[str]] = None) -> int:
+    """
+    Mark the given notifications (or all of them when ids is None) as read.
+    Returns how many changed from unread to read.
+    """
+    query = {"user_id": user_id, "is_read": False}
+    if notification_ids is not None:
+        query["_id"] = {"$in": to_object_ids(notification_ids)}
+
+    result = await db.notifications.update_many(query, {"$set": {"is_read": True}})
+    await _decrement_unread(user_id, result.modified_count)
+    return result.modified_count
+
+async def mark_one_read(user_id: str, notification_id: str) -> Optional[dict]:
+    """Mark a single notification as read and return it, or None if it isn't the user's."""
+    oids = to_object_ids([notification_id])
+    if not oids:
+        return None
+    before = await db.notifications.find_one_and_update(
+        {"_id": oids[0], "user_id": user_id},
+        {"$set": {"is_read": True}},
+        return_document=ReturnDocument.BEFORE
+    )
+    if before is None:
+        return None
+    if not before.get("is_read"):
+        await _decrement_unread(user_id, 1)
+    before["is_read"] = True
+    return before
+
+async def _decrement_unread(user_id: str, count: int):
+    if count:
+        await db.notification_counters.update_one({"_id": user_id}, {"$inc": {"unread": -count, "version": 1}})
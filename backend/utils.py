@@ -1,7 +1,46 @@
 import re
+from datetime import datetime, timezone
+from typing import Iterable, List
+from bson import ObjectId
+from bson.errors import InvalidId
 
 def normalize_phone(phone: str) -> str:
     """
     Normalize phone number by removing all non-digit characters.
     """
-    return re.sub(r'\D', '', phone)
\ No newline at end of file
+    return re.sub(r'\D', '', phone)
+
+def to_object_ids(ids: Iterable) -> List[ObjectId]:
+    """
+    Convert string ids to ObjectIds, skipping any that are missing or malformed.
+    """
+    oids = []
+    for i in ids:
+        if not i:
+            continue
+        try:
+            oids.append(ObjectId(i))
+        except (InvalidId, TypeError):
+            continue
+    return oids
+
+def as_utc(value: datetime) -> datetime:
+    """
+    Mongo returns naive datetimes that are in UTC; make them timezone-aware.
+    """
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def normalize_place_name(name: str) -> str:
+    """
+    Normalize a destination name for place matching: lowercase, single spaces.
+    """
+    return " ".join((name or "").lower().split())
+
+def place_key(destination: dict) -> str:
+    """
+    Canonical key for the physical place of a destination document: its Google
+    place id when verified, otherwise its normalized name.
+    """
+    if destination.get("google_place_id"):
+        return f"gp:{destination['google_place_id']}"
+    return f"name:{normalize_place_name(destination.get('name'))}"
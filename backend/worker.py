@@ -0,0 +1,60 @@
+import asyncio
+import logging
+import os
+import signal
+import sys
+
+# Allow running as a script: python worker.py
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config import settings
+from indexes import ensure_indexes
+from jobs import JobWorker
+from logs import configure_logging
+from services.events import InMemoryBroker, get_broker
+import matching  # noqa: F401  (registers the matching job handlers)
+
+configure_logging()
+
+async def main():
+    """
+    Standalone job worker. Run one or more of these next to the API (with
+    JOB_QUEUE_INLINE_WORKER=false) to scale matching independently of requests.
+
+    Notifications created here (match_found) are pushed through this process's
+    event broker. For them to reach SSE clients connected to the API, install a
+    shared broker (Redis pub/sub, a Mongo change stream, ...) with
+    services.events.set_broker() in both the API and the worker.
+    """
+    await ensure_indexes()
+    if settings.SCHEDULE_INDEX_ENABLED:
+        # The in-process index only sees writes made by the API process
+        logging.getLogger(__name__).warning("SCHEDULE_INDEX_ENABLED has no effect in a standalone worker; matching queries Mongo")
+    if isinstance(get_broker(), InMemoryBroker):
+        # Notifications are still stored; clients see them on their next fetch, just not pushed
+        logging.getLogger(__name__).warning(
+            "Event broker is in-memory: notifications created by this worker are not pushed to "
+            "SSE clients of the API; install a shared broker with services.events.set_broker()"
+        )
+    worker = JobWorker()
+    worker.start()
+
+    stop = asyncio.Event()
+    if os.name != 'nt':
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await worker.stop()
+
+if __name__ == "__main__":
+    # Fix for Windows asyncio loop policy
+    if os.name == 'nt':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -1,5 +1,5 @@
 @echo off
 echo Starting Backend...
 cd backend
-python -m uvicorn main:app --reload --port 8000
+python -m uvicorn main:app --reload --port 8000 --no-access-log
 pause
\ No newline at end of file